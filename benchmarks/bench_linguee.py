@@ -0,0 +1,50 @@
+"""
+Time how long each LingueeParser backend takes to parse a results page.
+
+Run from the project root with
+    python -m benchmarks.bench_linguee
+"""
+import argparse
+import contextlib
+import io
+import time
+
+from benchmarks.fixtures import FIXTURES
+from main.translation.LingueeParser import LingueeParser
+
+LINGUEE_FIXTURES = FIXTURES / 'linguee'
+
+
+def time_backend(backend: str, pages, repeat: int):
+    parser = LingueeParser(backend)
+    times = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            for content in pages:
+                start = time.perf_counter()
+                parser.translate('benchmark', content)
+                times.append(time.perf_counter() - start)
+    return times
+
+
+def main():
+    args = configure_args()
+    pages = [
+        path.read_bytes()
+        for path in sorted(LINGUEE_FIXTURES.glob('*.html'))]
+    for backend in LingueeParser.BACKENDS:
+        times = sorted(time_backend(backend, pages, args.repeat))
+        median = times[len(times) // 2]
+        print(f'{backend: <12} median {median * 1000:.2f}ms per page, '
+              f'max {times[-1] * 1000:.2f}ms')
+
+
+def configure_args():
+    description = 'Benchmark the Linguee page parser backends'
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--repeat', type=int, default=20)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""
+Compare the old and new ways of splitting Body.data into entries.
+
+Run from the project root with
+    python -m benchmarks.bench_parse_dict
+"""
+import argparse
+import contextlib
+import io
+import tempfile
+import time
+
+from benchmarks.fixtures import synthetic_body_data
+from benchmarks.legacy import legacy_parse
+from main.translation.parse_dictionaries import parse_dict
+
+
+def time_it(function, *args, repeat: int = 3):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        # parse_dict prints its progress - we don't want it in the timings.
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = function(*args)
+            best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    args = configure_args()
+    with tempfile.TemporaryDirectory() as directory:
+        path = synthetic_body_data(
+            f'{directory}/Body.data', args.blocks, args.entries_per_block)
+        legacy_time, legacy_entries = time_it(legacy_parse, path)
+        new_time, new_entries = time_it(parse_dict._parse, path)
+    print(f'Entries: {len(new_entries)}')
+    print(f'Old _parse/_split: {legacy_time:.3f}s')
+    print(f'New _parse/_split: {new_time:.3f}s')
+    print(f'Speed-up: {legacy_time / new_time:.1f}x')
+
+
+def configure_args():
+    description = 'Benchmark parsing a synthetic Apple Body.data file'
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--blocks', type=int, default=200)
+    parser.add_argument('--entries_per_block', type=int, default=50)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main()
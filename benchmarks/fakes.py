@@ -0,0 +1,416 @@
+"""
+Local stand-ins for every service the flashcard pipeline talks to:
+AnkiConnect, the crunchy nut server's /phrase/ API, Linguee, verbformen and
+DeepL.
+
+Each runs an HTTP server on a free local port in a background thread, and
+can be made slow (`latency`, plus up to `jitter` more, in seconds) or
+unreliable (`error_rate`, the chance of answering a request with a 503, as
+Linguee does when it's throttling us). None of this imports the pipeline, so
+that the pipeline can be imported after its URLs have been pointed here.
+"""
+import hashlib
+import json
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks.fixtures import FIXTURES
+
+
+class FakeService:
+    name = 'service'
+
+    def __init__(
+            self, latency: float = 0.0, jitter: float = 0.0,
+            error_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        # Requests and injected errors, by endpoint.
+        self.requests: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                self.reply('GET')
+
+            def do_POST(self):
+                self.reply('POST')
+
+            def reply(self, method: str):
+                length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(length) if length else b''
+                url = urlparse(self.path)
+                query = {
+                    key: values[0]
+                    for key, values in parse_qs(url.query).items()}
+                status, content_type, content = service.respond(
+                    method, url.path, query, self.headers, body)
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.httpd.server_address[1]}'
+        self.thread = threading.Thread(
+            target=self.httpd.serve_forever, daemon=True)
+
+    def respond(self, method, path, query, headers, body):
+        endpoint = self.endpoint(method, path, query, body)
+        with self.lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            throttled = self.random.random() < self.error_rate
+            if throttled:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+        if delay > 0:
+            time.sleep(delay)
+        if throttled:
+            return 503, 'text/plain', b'Service Unavailable'
+        return self.handle(method, path, query, headers, body)
+
+    def endpoint(self, method, path, query, body) -> str:
+        return f'{method} {path}'
+
+    def handle(self, method, path, query, headers, body):
+        raise NotImplementedError
+
+    def stats(self):
+        with self.lock:
+            return {
+                'url': self.url,
+                'requests': dict(self.requests),
+                'errors': dict(self.errors)}
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def json_reply(data, status: int = 200):
+    return status, 'application/json', json.dumps(data).encode('utf-8')
+
+
+class FakeAnkiConnect(FakeService):
+    # Speaks enough of the AnkiConnect protocol for Connector: decks start
+    # empty (unless given `notes`, a list of {'deck', 'fields'} dicts), and
+    # stay that way - imported packages are read into `imported_notes`, but
+    # not added to the decks. Actions in `failures` (which can include
+    # 'multi') give back an error.
+    name = 'anki'
+
+    def __init__(self, notes: List[dict] = (), failures=(), **kwargs):
+        super().__init__(**kwargs)
+        self.imported: List[str] = []
+        self.imported_notes: List[dict] = []
+        self.notes = list(notes)
+        self.failures = set(failures)
+
+    def endpoint(self, method, path, query, body):
+        return json.loads(body).get('action', '?')
+
+    def handle(self, method, path, query, headers, body):
+        request = json.loads(body)
+        return json_reply(self.perform(request))
+
+    def perform(self, request):
+        action = request['action']
+        params = request.get('params', {})
+        error = None
+        if action in self.failures:
+            result, error = None, f'{action} failed'
+        elif action == 'multi':
+            result = [self.perform(item) for item in params['actions']]
+        elif action == 'requestPermission':
+            result = {'permission': 'granted', 'version': 6}
+        elif action == 'version':
+            result = 6
+        elif action == 'findNotes':
+            deck = params['query'][len('deck:"'):-1]
+            result = [
+                id for id, note in enumerate(self.notes, 1)
+                if note['deck'] == deck]
+        elif action == 'notesInfo':
+            result = [
+                {'noteId': id, 'fields': {
+                    name: {'value': value, 'order': order}
+                    for order, (name, value)
+                    in enumerate(self.notes[id - 1]['fields'].items())}}
+                for id in params['notes']]
+        elif action == 'importPackage':
+            notes = read_package(params['path'])
+            with self.lock:
+                self.imported.append(params['path'])
+                self.imported_notes.extend(notes)
+            result = True
+        else:
+            result = None
+        # From version 5, results are wrapped.
+        if request.get('version', 4) >= 5:
+            return {'result': result, 'error': error}
+        return result
+
+    def stats(self):
+        stats = super().stats()
+        stats['imported'] = len(self.imported)
+        return stats
+
+
+def read_package(path: str) -> List[dict]:
+    # The notes in an .apkg, as {'deck', 'fields'} dicts.
+    with zipfile.ZipFile(path) as package, \
+            tempfile.TemporaryDirectory() as directory:
+        connection = sqlite3.connect(
+            package.extract('collection.anki2', directory))
+        try:
+            decks, models = connection.execute(
+                'SELECT decks, models FROM col').fetchone()
+            rows = connection.execute(
+                'SELECT DISTINCT notes.id, mid, flds, did FROM notes '
+                'JOIN cards ON cards.nid = notes.id '
+                'ORDER BY notes.id').fetchall()
+        finally:
+            connection.close()
+    decks = {int(id): deck['name'] for id, deck in json.loads(decks).items()}
+    fields = {
+        int(id): [field['name'] for field in model['flds']]
+        for id, model in json.loads(models).items()}
+    return [
+        {'deck': decks[deck], 'fields': dict(
+            zip(fields[model], values.split('\x1f')))}
+        for _, model, values, deck in rows]
+
+
+class FakePhraseServer(FakeService):
+    # The crunchy nut server's /phrase/ API, for `users` users with
+    # `phrases` unflashcarded phrases each (more can be added with add).
+    # Each user's token is 'token <user>'. If `paginates` is False, it
+    # ignores since/after/limit and sends every phrase, and if `bulk` is
+    # False, it has no /phrase/bulk, like an older server would. Posts of
+    # phrases in `failures` fail once.
+    name = 'server'
+
+    def __init__(
+            self, users: List[str], phrases: int = 0, paginates: bool = True,
+            bulk: bool = True, **kwargs):
+        super().__init__(**kwargs)
+        self.paginates = paginates
+        self.bulk = bulk
+        self.failures = set()
+        # The query of each GET, the path of each POST, and the german of
+        # each phrase posted back successfully, in order.
+        self.queries: List[Dict[str, str]] = []
+        self.posts: List[str] = []
+        self.posted: List[str] = []
+        vocabulary = [
+            json.loads(path.read_text(encoding='utf-8'))['query']
+            for path in sorted((FIXTURES / 'linguee').glob('*.json'))]
+        self.phrases: Dict[str, Dict[str, dict]] = {}
+        for user in users:
+            self.phrases[user] = {}
+            for n in range(phrases):
+                german = vocabulary[n % len(vocabulary)] if n % 4 == 0 \
+                    else f'Wort{n}'
+                # Every tenth phrase comes with its own translation.
+                self.add(german, user, 'word' if n % 10 == 1 else '')
+
+    def add(self, german: str, owner: str = None, english: str = '') -> dict:
+        # Phrases are added a second apart, from midnight on New Year's Day.
+        with self.lock:
+            if owner is None:
+                owner = next(iter(self.phrases))
+            owned = self.phrases[owner]
+            n = len(owned)
+            id = hashlib.sha1(f'{owner}/{n}'.encode()).hexdigest()[:24]
+            owned[id] = {
+                '_id': id, 'german': german, 'owner': owner,
+                'english': english, 'deck_name': 'Fluency Lube',
+                'translations': [],
+                'database_date':
+                    f'2021-01-{1 + n // 86400:02d}T{n // 3600 % 24:02d}:'
+                    f'{n // 60 % 60:02d}:{n % 60:02d}.000Z'}
+            return owned[id]
+
+    def endpoint(self, method, path, query, body):
+        if path == '/phrase/bulk':
+            return f'{method} /phrase/bulk'
+        return f'{method} /phrase/'
+
+    def owner(self, headers):
+        authorization = headers.get('Authorization', '')
+        user = authorization[len('token '):]
+        return user if user in self.phrases else None
+
+    def handle(self, method, path, query, headers, body):
+        owner = self.owner(headers)
+        if owner is None:
+            return json_reply({'error': 'Unauthorised'}, 401)
+        if method == 'GET':
+            with self.lock:
+                self.queries.append(query)
+            return json_reply(self.select(owner, query))
+        with self.lock:
+            self.posts.append(path)
+        data = json.loads(body)
+        if path == '/phrase/bulk':
+            if not self.bulk:
+                return json_reply({'error': 'Not found'}, 404)
+            return json_reply([self.update(owner, item) for item in data])
+        result = self.update(owner, data)
+        if result['ok']:
+            return json_reply(data)
+        return json_reply(result, 404 if 'error' in result else 500)
+
+    def select(self, owner: str, query):
+        with self.lock:
+            phrases = sorted(
+                self.phrases[owner].values(),
+                key=lambda data: (data['database_date'], data['_id']))
+        if query.get('flashcarded', 'false') == 'false':
+            phrases = [
+                data for data in phrases
+                if data.get('flashcard_date') is None]
+        if not self.paginates:
+            return phrases
+        if 'since' in query:
+            cursor = query['since'], query.get('after', '')
+            phrases = [
+                data for data in phrases
+                if (data['database_date'], data['_id']) > cursor]
+        if 'limit' in query:
+            phrases = phrases[:int(query['limit'])]
+        return phrases
+
+    def update(self, owner: str, data):
+        if data.get('id') is None:
+            # A new phrase, e.g. from flashcards_from_file.
+            phrase = self.add(
+                data.get('german'), owner, data.get('english') or '')
+            phrase['deck_name'] = data.get('deck_name')
+            data = {**data, 'id': phrase['_id']}
+        with self.lock:
+            if data.get('german') in self.failures:
+                self.failures.remove(data['german'])
+                return {'ok': False}
+            phrase = self.phrases[owner].get(data['id'])
+            if phrase is None:
+                return {'ok': False, 'error': 'Not found'}
+            phrase['flashcard_date'] = data.get('flashcard_date')
+            phrase['translations'] = data.get('translations', [])
+            self.posted.append(phrase['german'])
+        return {'ok': True}
+
+    def flashcarded(self) -> int:
+        with self.lock:
+            return sum(
+                data.get('flashcard_date') is not None
+                for owned in self.phrases.values()
+                for data in owned.values())
+
+    def stats(self):
+        stats = super().stats()
+        stats['flashcarded'] = self.flashcarded()
+        return stats
+
+
+class FakePages(FakeService):
+    # Serves the saved pages in tests/fixtures/<directory>, choosing the one
+    # for the query if there is one, otherwise one chosen by the query's hash
+    # (so each query always gets the same page).
+    directory = ''
+    parameter = ''
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.pages = {}
+        for path in sorted((FIXTURES / self.directory).glob('*.html')):
+            self.pages[self.query_of(path)] = path.read_bytes()
+        self.ordered = [self.pages[query] for query in sorted(self.pages)]
+
+    def query_of(self, path: Path) -> str:
+        return path.stem
+
+    def handle(self, method, path, query, headers, body):
+        key = query.get(self.parameter, '')
+        page = self.pages.get(key)
+        if page is None:
+            digest = hashlib.sha1(key.encode('utf-8')).digest()
+            page = self.ordered[digest[0] % len(self.ordered)]
+        return 200, 'text/html; charset=utf-8', page
+
+
+class FakeLinguee(FakePages):
+    name = 'linguee'
+    directory = 'linguee'
+    parameter = 'query'
+
+    def query_of(self, path: Path) -> str:
+        golden = json.loads(
+            path.with_suffix('.json').read_text(encoding='utf-8'))
+        return golden['query']
+
+
+class FakeVerbformen(FakePages):
+    name = 'verbformen'
+    directory = 'verbformen'
+    parameter = 'w'
+
+
+class FakeDeepL(FakeService):
+    # /v2/translate, as used by the deepl package. The 'translation' of each
+    # text is just the text in brackets.
+    name = 'deepl'
+
+    def handle(self, method, path, query, headers, body):
+        if path != '/v2/translate':
+            return json_reply({'message': 'Not found'}, 404)
+        texts = json.loads(body)['text']
+        return json_reply({'translations': [
+            {'detected_source_language': 'DE', 'text': f'[{text}]',
+             'billed_characters': len(text)}
+            for text in texts]})
+
+
+class FakeAuthorizer:
+    # Stands in for main.authorization's Authorizer, which needs real
+    # credentials: each user's phrase server token is 'token <user>', which
+    # is what FakePhraseServer expects, and DeepL gets a made-up free key.
+    def __init__(self, users):
+        self.users = users
+        self.me = users[0]
+
+    def crunchy_nut_authorization(self, owner: str):
+        return f'token {owner}'
+
+    def deepl_authorization(self, user_name: str):
+        return 'load-test:fx'
+
+
+SERVICES = {
+    service.name: service
+    for service in [
+        FakeAnkiConnect, FakePhraseServer, FakeLinguee, FakeVerbformen,
+        FakeDeepL]}
@@ -0,0 +1,61 @@
+"""
+Synthetic fixtures for the benchmarks.
+
+None of these need a network connection, Anki or the real Apple dictionary.
+"""
+import struct
+import zlib
+from pathlib import Path
+from typing import List
+
+# The saved pages, dictionary and golden files that the tests and benchmarks
+# share.
+FIXTURES = Path(__file__).parent.parent / 'tests' / 'fixtures'
+
+NAMESPACE = 'http://www.apple.com/DTDs/DictionaryService-1.0.rng'
+
+GENDERS = ['masculine', 'feminine', 'neuter']
+
+
+def synthetic_entry(n: int) -> str:
+    """A noun entry shaped like the ones in the German-English Body.data."""
+    word = f'Wort{n}'
+    gender = GENDERS[n % len(GENDERS)]
+    return (
+        f'<d:entry xmlns:d="{NAMESPACE}" id="de_en_{n}" d:title="{word}" '
+        f'class="entry"><span class="hg x_xh0"><span class="hw">{word}'
+        f'</span></span><span class="gramb x_xd0"><span class="ps">{gender} '
+        f'noun</span> <span>Pl. </span><span class="fg">'
+        f'<span class="f">{word}e</span></span></span></d:entry>')
+
+
+def synthetic_block(entries: List[str]) -> bytes:
+    # Each entry is prefixed by four bytes that aren't UTF-8 and followed by
+    # a new line, which is what parse_dict._split expects.
+    block = b''
+    for entry in entries:
+        entry_bytes = entry.encode('utf-8') + b'\n'
+        block += struct.pack('<I', len(entry_bytes)) + entry_bytes
+    return block
+
+
+def synthetic_body_data(
+        path: str, blocks: int = 200, entries_per_block: int = 50) -> str:
+    """Write a fake Body.data of `blocks` zlib blocks to `path`."""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'wb') as file:
+        # The first zip file starts at ~100 bytes.
+        file.write(bytes(100))
+        for b in range(blocks):
+            entries = [
+                synthetic_entry(b * entries_per_block + e)
+                for e in range(entries_per_block)]
+            compressed = zlib.compress(synthetic_block(entries))
+            # Apple puts a 12 byte header before each block.
+            file.write(struct.pack('<III', len(compressed) + 8, 0, 0))
+            file.write(compressed)
+        advisory = '<d:entry d:title="fbm_AdvisoryBoard"></d:entry>'
+        compressed = zlib.compress(synthetic_block([advisory]))
+        file.write(struct.pack('<III', len(compressed) + 8, 0, 0))
+        file.write(compressed)
+    return path
@@ -0,0 +1,247 @@
+"""
+Run flashcards_from_server against local stand-ins for every service it
+talks to (see benchmarks.fakes), and report how fast it got through the
+phrases and how long each stage took.
+
+Run from the project root with e.g.
+    python -m benchmarks.load_test --users 20 --phrases 200 \\
+        --latency all=0.02 --latency linguee=0.1 --error-rate linguee=0.01
+
+Nothing real is touched: the pipeline's URLs are pointed at the stand-ins,
+and logs, caches and metrics all go to a temporary directory.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from contextlib import ExitStack
+from functools import cached_property
+from pathlib import Path
+from urllib.parse import urlparse
+
+from benchmarks.fakes import SERVICES, FakeAnkiConnect, FakeAuthorizer, \
+    FakeDeepL, FakeLinguee, FakePhraseServer, FakeVerbformen
+from benchmarks.fixtures import FIXTURES
+
+# The stages to report, in the order they happen. Anything else that was
+# timed is reported after these.
+STAGES = [
+    'run', 'server.get_phrases', 'translate_many', 'translate',
+    'linguee.fetch', 'linguee.parse', 'add_noun_plurals', 'conjugate_verbs',
+    'deepl', 'anki.wait', 'anki.preflight', 'anki.output_decks',
+    'anki.update', 'anki.connect', 'server.post_phrases', 'http']
+
+
+def start_services(stack: ExitStack, args):
+    users = [f'user{n}' for n in range(args.users)]
+    settings = {}
+    for name in SERVICES:
+        settings[name] = {
+            'latency': setting(args.latency, name, 0.0),
+            'jitter': setting(args.jitter, name, 0.0),
+            'error_rate': setting(args.error_rate, name, 0.0),
+            'seed': args.seed}
+    return users, {
+        'anki': stack.enter_context(FakeAnkiConnect(**settings['anki'])),
+        'server': stack.enter_context(FakePhraseServer(
+            users, args.phrases, **settings['server'])),
+        'linguee': stack.enter_context(FakeLinguee(**settings['linguee'])),
+        'verbformen': stack.enter_context(
+            FakeVerbformen(**settings['verbformen'])),
+        'deepl': stack.enter_context(FakeDeepL(**settings['deepl']))}
+
+
+def setting(values, name: str, default: float) -> float:
+    # `values` are the NAME=VALUE arguments, where NAME can be 'all'.
+    settings = dict(value.split('=', 1) for value in values)
+    return float(settings.get(name, settings.get('all', default)))
+
+
+def run_pipeline(args, users, services, directory: str):
+    # Point the pipeline at the stand-ins before any of it is imported, since
+    # it reads the URLs when it's imported.
+    os.environ.update({
+        'ANKI_CONNECT_URL': services['anki'].url,
+        'CRUNCHY_NUT_URL': services['server'].url,
+        'LINGUEE_URL': services['linguee'].url,
+        'VERBFORMEN_URL': services['verbformen'].url,
+        'DEEPL_SERVER_URL': services['deepl'].url,
+        'FLASHCARDS_LOG_DIR': f'{directory}/logs'})
+    if 'main.utils' in sys.modules:
+        raise RuntimeError(
+            'The pipeline was imported before its URLs were set')
+    import flashcards_from_server
+    from main.anki.Connector import Connector
+    from main.Metrics import Metrics
+    from main.server.Server import Server
+    from main.server.SyncCursor import SyncCursor
+    from main.SharedResources import SharedResources
+    from main.translation.ConjugationIndex import ConjugationIndex
+    from main.translation.PageCache import PageCache
+    from main.translation.parse_dictionaries import parse_dict
+    from main.translation.parse_dictionaries.dictionary_store import \
+        DictionaryStore
+    from main.translation.TranslationCache import TranslationCache
+    from main.utils import wait_for_anki
+
+    class LoadTestResources(SharedResources):
+        # Everything lives in the temporary directory, and Anki is the
+        # stand-in, so there's nothing to launch.
+        @cached_property
+        def apple_dict(self):
+            store_path = f'{directory}/apple_german_english.sqlite'
+            dictionary = parse_dict.parse(
+                str(FIXTURES / 'dictionary' / 'Body.data'))
+            parse_dict.write_store(store_path, dictionary)
+            return DictionaryStore(store_path)
+
+        @cached_property
+        def translation_cache(self):
+            if self.use_cache:
+                return TranslationCache(f'{directory}/translations.db')
+            return None
+
+        @cached_property
+        def page_cache(self):
+            if self.use_cache:
+                return PageCache(f'{directory}/pages.db')
+            return None
+
+        @cached_property
+        def conjugations(self):
+            if self.use_cache:
+                return ConjugationIndex(f'{directory}/conjugations.db')
+            return None
+
+        @cached_property
+        def connector(self):
+            if not wait_for_anki(deadline=10):
+                raise RuntimeError('The fake AnkiConnect isn\'t answering')
+            return Connector()
+
+    pipeline_args = ['--concurrency', str(args.concurrency),
+                     '--per-host-rate', str(args.per_host_rate)]
+    if not args.cache:
+        pipeline_args.append('--no-cache')
+    pipeline_args = flashcards_from_server.configure_args(pipeline_args)
+    authorizer = FakeAuthorizer(users)
+    server = Server(
+        authorizer=authorizer,
+        cursors=SyncCursor(f'{directory}/cursors.db'))
+    resources = LoadTestResources(
+        use_cache=args.cache, authorizer=authorizer)
+    metrics = Metrics.shared()
+    metrics.keep_samples = True
+    # The pipeline logs every step - keep it out of the report.
+    logs = contextlib.nullcontext() if args.show_log \
+        else contextlib.redirect_stdout(io.StringIO())
+    with metrics.run('load_test', f'{directory}/metrics'), logs:
+        start = time.perf_counter()
+        flashcards_from_server.check_for_phrases(
+            pipeline_args, server, resources)
+        seconds = time.perf_counter() - start
+    return seconds, metrics.summary('load_test')
+
+
+def report(args, seconds, summary, services):
+    flashcarded = services['server'].flashcarded()
+    total = args.users * args.phrases
+    # Name hosts after the service behind them, rather than their ports.
+    hosts = {
+        urlparse(service.url).netloc: name
+        for name, service in services.items()}
+    for item in summary['spans'] + summary['counters']:
+        if 'host' in item['labels']:
+            host = item['labels']['host']
+            item['labels']['host'] = hosts.get(host, host)
+    spans = sorted(
+        summary['spans'],
+        key=lambda span: (
+            STAGES.index(span['name']) if span['name'] in STAGES
+            else len(STAGES), span['name'], sorted(span['labels'].items())))
+    return {
+        'users': args.users,
+        'phrases': total,
+        'flashcarded': flashcarded,
+        'seconds': seconds,
+        'phrases_per_second': flashcarded / seconds if seconds else None,
+        'stages': spans,
+        'counters': summary['counters'],
+        'services': {
+            name: service.stats() for name, service in services.items()}}
+
+
+def print_report(result):
+    print(f'{result["flashcarded"]}/{result["phrases"]} phrases flashcarded '
+          f'for {result["users"]} users in {result["seconds"]:.2f}s '
+          f'({result["phrases_per_second"]:.1f} phrases/s)')
+    print()
+    print(f'{"stage": <44}{"calls": >7}{"p50": >10}{"p90": >10}{"p99": >10}'
+          f'{"max": >10}{"total": >10}')
+    for stage in result['stages']:
+        labels = ','.join(f'{value}' for value in stage['labels'].values())
+        name = f'{stage["name"]} ({labels})' if labels else stage['name']
+        print(f'{name[:43]: <44}{stage["calls"]: >7}'
+              + ''.join(
+                  f'{stage.get(key, 0) * 1000: >8.1f}ms'
+                  for key in ['p50_seconds', 'p90_seconds', 'p99_seconds',
+                              'max_seconds'])
+              + f'{stage["seconds"]: >9.2f}s')
+    print()
+    for name, stats in result['services'].items():
+        requests = sum(stats['requests'].values())
+        errors = sum(stats['errors'].values())
+        print(f'{name: <12}{requests: >7} requests{errors: >6} injected 5xx')
+
+
+def main():
+    args = configure_args()
+    with tempfile.TemporaryDirectory() as directory, ExitStack() as stack:
+        users, services = start_services(stack, args)
+        seconds, summary = run_pipeline(args, users, services, directory)
+        result = report(args, seconds, summary, services)
+    print_report(result)
+    if args.output is not None:
+        Path(args.output).write_text(json.dumps(result, indent=2) + '\n')
+
+
+def configure_args():
+    description = (
+        'Load test flashcards_from_server against local stand-ins for '
+        'AnkiConnect, the crunchy nut server, Linguee, verbformen and DeepL')
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument(
+        '--phrases', type=int, default=100, help='Phrases per user.')
+    services = ', '.join(['all', *SERVICES])
+    parser.add_argument(
+        '--latency', action='append', default=[], metavar='SERVICE=SECONDS',
+        help=f'How long a service takes to answer. SERVICE is one of '
+             f'{services}. Can be given more than once.')
+    parser.add_argument(
+        '--jitter', action='append', default=[], metavar='SERVICE=SECONDS',
+        help='Up to how much longer than --latency a service can take.')
+    parser.add_argument(
+        '--error-rate', action='append', default=[], metavar='SERVICE=RATE',
+        help='Chance of a service answering with a 503.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument(
+        '--per-host-rate', type=float, default=0,
+        help='As for flashcards_from_server. Defaults to no limit.')
+    parser.add_argument(
+        '--cache', action='store_true',
+        help='Use (fresh) translation and page caches.')
+    parser.add_argument(
+        '--show-log', action='store_true',
+        help='Show the pipeline\'s log output.')
+    parser.add_argument('--output', help='Also write the report as JSON.')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+"""
+Time the parsers and dictionary lookups on the checked-in fixtures, and
+write the results as JSON so they can be compared between commits.
+
+Nothing here needs a network connection, Anki or any credentials. Run from
+the project root with
+    python -m benchmarks.suite --output results.json
+and compare against the checked-in baseline with
+    python -m benchmarks.suite --compare benchmarks/baseline.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+from typing import Callable, Dict
+
+from bs4 import BeautifulSoup
+
+from benchmarks.fixtures import FIXTURES
+
+# Everything we time logs a lot. Send the logs to a temporary directory
+# rather than main/logs before any of the pipeline is imported, and turn
+# them down (below) so that no log I/O happens inside the timed loops.
+_LOG_DIR = tempfile.TemporaryDirectory()
+os.environ['FLASHCARDS_LOG_DIR'] = _LOG_DIR.name
+
+from main.anki.NoteTaker import NoteTaker  # noqa: E402
+from main.logs.log import WARNING, set_level  # noqa: E402
+from main.translation.ConjugationIndex import find_conjugation  # noqa: E402
+from main.translation.PageCache import Page  # noqa: E402
+from main.translation.parse_dictionaries import parse_dict  # noqa: E402
+from main.translation.parse_dictionaries import dictionary_store  # noqa: E402
+from main.translation.Translation import Translation  # noqa: E402
+from main.translation.Translator import Translator  # noqa: E402
+from main.utils import project_root  # noqa: E402
+
+LINGUEE_FIXTURES = FIXTURES / 'linguee'
+VERBFORMEN_FIXTURES = FIXTURES / 'verbformen'
+BODY_DATA = FIXTURES / 'dictionary' / 'Body.data'
+BASELINE = Path(project_root(), 'benchmarks', 'baseline.json')
+
+# Each benchmark is set up once by its function, which returns the callable
+# to time.
+BENCHMARKS: Dict[str, Callable[['Fixtures'], Callable[[], object]]] = {}
+
+
+def benchmark(name: str):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+class OfflineAuthorizer:
+    # Only used to construct the DeepL client, which we never call.
+    def deepl_authorization(self, user_name: str):
+        return 'offline:fx'
+
+
+class Fixtures:
+    # Everything the benchmarks share, loaded once.
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.linguee_pages = {
+            path.stem: path.read_bytes()
+            for path in sorted(LINGUEE_FIXTURES.glob('*.html'))}
+        self.verbformen_pages = [
+            path.read_bytes()
+            for path in sorted(VERBFORMEN_FIXTURES.glob('*.html'))]
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.dictionary = parse_dict.parse(str(BODY_DATA))
+            store_path = f'{directory}/apple_german_english.sqlite'
+            parse_dict.write_store(store_path, self.dictionary)
+        self.store = dictionary_store.DictionaryStore(store_path)
+
+    def translator(self, apple_dict) -> Translator:
+        return Translator(
+            'benchmark', apple_dict=apple_dict,
+            authorizer=OfflineAuthorizer())
+
+    def nouns(self):
+        return [
+            Translation(key, category=f'noun, {gender}')
+            for key, gender in zip(
+                sorted(self.dictionary)[:100],
+                ['masculine', 'feminine', 'neuter'] * 34)]
+
+    def close(self):
+        self.store.close()
+
+
+@benchmark('parse_dict._parse')
+def parse_body_data(fixtures: Fixtures):
+    return lambda: parse_dict._parse(str(BODY_DATA))
+
+
+@benchmark('parse_dict._split')
+def split_block(fixtures: Fixtures):
+    with open(BODY_DATA, 'rb') as file:
+        content = file.read()
+    _, _, block = next(parse_dict._find_blocks(content, 100))
+    return lambda: parse_dict._split(block, verbose=False)
+
+
+@benchmark('Translator.linguee_translate')
+def linguee_translate(fixtures: Fixtures):
+    translator = fixtures.translator(fixtures.store)
+    pages = [
+        (german, Page(german, 200, content))
+        for german, content in fixtures.linguee_pages.items()]
+
+    def translate_pages():
+        for german, page in pages:
+            translator.linguee_translate(german, page)
+    return translate_pages
+
+
+@benchmark('Translation.find_plural')
+def find_plural(fixtures: Fixtures):
+    soups = [
+        (translation, BeautifulSoup(fixtures.dictionary[translation.german],
+                                    'html.parser'))
+        for translation in fixtures.nouns()]
+
+    def find_plurals():
+        for translation, soup in soups:
+            translation.find_plural(soup)
+    return find_plurals
+
+
+@benchmark('Translation.format_contents')
+def format_contents(fixtures: Fixtures):
+    tags = []
+    for content in fixtures.linguee_pages.values():
+        soup = BeautifulSoup(content, 'html.parser')
+        for lemma in soup.find_all(class_='line lemma_desc'):
+            tags.extend(lemma.find_all(class_='dictLink'))
+
+    def format_tags():
+        for tag in tags:
+            Translation.format_contents(tag)
+    return format_tags
+
+
+@benchmark('Translator.add_noun_plurals (store)')
+def add_noun_plurals_store(fixtures: Fixtures):
+    translator = fixtures.translator(fixtures.store)
+    return lambda: translator.add_noun_plurals(fixtures.nouns())
+
+
+@benchmark('Translator.add_noun_plurals (dict)')
+def add_noun_plurals_dict(fixtures: Fixtures):
+    translator = fixtures.translator(fixtures.dictionary)
+    return lambda: translator.add_noun_plurals(fixtures.nouns())
+
+
+@benchmark('find_conjugation')
+def conjugations(fixtures: Fixtures):
+    def find_conjugations():
+        for content in fixtures.verbformen_pages:
+            find_conjugation(content)
+    return find_conjugations
+
+
+@benchmark('NoteTaker.output_deck')
+def output_deck(fixtures: Fixtures):
+    note_taker = NoteTaker()
+    for translation in fixtures.nouns():
+        translation.english = 'word'
+        translation.plural = f'{translation.german}e'
+        note_taker.add_note(translation, 'Benchmark')
+
+    def write_deck():
+        os.remove(note_taker.output_deck('Benchmark'))
+    return write_deck
+
+
+def run(names, repeat: int):
+    results = {}
+    set_level(WARNING)
+    with tempfile.TemporaryDirectory() as directory:
+        # parse_dict prints its progress - keep it out of the way too.
+        with contextlib.redirect_stdout(io.StringIO()):
+            fixtures = Fixtures(directory)
+            try:
+                for name in names:
+                    timer = timeit.Timer(BENCHMARKS[name](fixtures))
+                    # Enough loops to take at least 0.2s, then the best few.
+                    loops, _ = timer.autorange()
+                    times = [
+                        time / loops
+                        for time in timer.repeat(repeat=repeat, number=loops)]
+                    results[name] = {
+                        'loops': loops,
+                        'min_seconds': min(times),
+                        'median_seconds': statistics.median(times)}
+            finally:
+                fixtures.close()
+    return results
+
+
+def commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=project_root(),
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold: float):
+    # Prints each benchmark against the baseline, and returns the names of
+    # those that are more than `threshold` times slower.
+    regressions = []
+    print(f'{"benchmark": <40}{"baseline": >12}{"now": >12}{"ratio": >8}')
+    for name, result in results.items():
+        before = baseline['benchmarks'].get(name)
+        # The quickest run is the least affected by whatever else the
+        # machine is doing.
+        now = result['min_seconds']
+        if before is None:
+            print(f'{name: <40}{"-": >12}{now * 1000: >10.3f}ms')
+            continue
+        ratio = now / before['min_seconds']
+        flag = ''
+        if ratio > threshold:
+            regressions.append(name)
+            flag = '  <- slower'
+        print(f'{name: <40}{before["min_seconds"] * 1000: >10.3f}ms'
+              f'{now * 1000: >10.3f}ms{ratio: >7.2f}x{flag}')
+    return regressions
+
+
+def main():
+    args = configure_args()
+    names = args.only if args.only else list(BENCHMARKS)
+    results = run(names, args.repeat)
+    report = {
+        'commit': commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'benchmarks': results}
+    if args.output is not None:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+            file.write('\n')
+    if args.compare is not None:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            sys.exit(1)
+    elif args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+def configure_args():
+    description = 'Benchmark the parsers and dictionary lookups offline'
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument(
+        '--output', help='Write the results to this JSON file.')
+    compare_help = (
+        'Compare against a previous results file (e.g. '
+        f'{BASELINE.relative_to(project_root())}) and exit with 1 if '
+        'anything got slower than --threshold.')
+    parser.add_argument('--compare', help=compare_help)
+    parser.add_argument('--threshold', type=float, default=1.5)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument(
+        '--only', nargs='+', choices=list(BENCHMARKS),
+        help='Only run these benchmarks.')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main()
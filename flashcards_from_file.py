@@ -1,32 +1,63 @@
 import argparse
 from datetime import datetime
 
+from main.anki.NoteTaker import NoteTaker
+from main.FileCursor import FileCursor
 from main.FlashcardMaker import FlashcardMaker
-from main.logs.log import log
+from main.logs.log import DEBUG, add_log_args, log, set_level
+from main.Metrics import Metrics
 from main.server.Phrase import Phrase
 from main.server.Server import Server
-from main.utils import open_anki
+from main.SharedResources import SharedResources
+from main.translation.TranslationCache import TranslationCache
+from main.utils import add_cache_args, add_metrics_args
 
 
-def main():
-    log('Generating flashcards from file...', new_entry=True)
+def main(argv=None):
+    args = configure_args(NoteTaker.DEFAULT_DECK_NAME, argv)
+    metrics_dir = None if args.no_metrics else args.metrics_dir
+    with Metrics.shared().run(
+            'flashcards_from_file', metrics_dir, args.profile):
+        flashcards_from_file(args)
+
 
-    already_open = open_anki()
-    log('Anki already open...' if already_open else 'Opened Anki...')
+def flashcards_from_file(args, server=None, resources=None, cursor=None):
+    log('Generating flashcards from file...', new_entry=True)
 
-    server = Server()
+    if server is None:
+        server = Server()
     user_name = server.authorizer.me
-    flashcard_maker = FlashcardMaker(user_name)
+    if resources is None:
+        resources = SharedResources(
+            use_cache=not args.no_cache, refresh_cache=args.refresh)
+    flashcard_maker = FlashcardMaker(user_name, resources)
+    if cursor is None:
+        cursor = FileCursor()
 
-    args = configure_args(flashcard_maker.note_taker.default_deck_name)
     log(f'File path is \'{args.filepath}\'...')
     log(f'Deck name is \'{args.deck_name}\'...')
 
-    def translate(german: str):
-        log(f'\nTranslating and flashcarding \'{german}\'...')
+    # Phrases we've already seen, in this file or on the server, so that
+    # each is only translated once.
+    seen = set()
+    if not args.include_known:
+        log('Checking the server for phrases we already know...')
+        seen.update(
+            TranslationCache.normalise(phrase.german)
+            for phrase in server.get_phrases(
+                user_name, include_flashcarded=True, incremental=False))
+
+    if args.restart:
+        cursor.reset(args.filepath, args.deck_name)
+    offset, hasher = cursor.get(args.filepath, args.deck_name)
+    if offset > 0:
+        log(f'Carrying on from byte {offset}...')
+
+    def flashcard(german: str, translations):
+        log(f'\nFlashcarding \'{german}\'...')
         phrase = Phrase(
             id=None, german=german, owner=user_name, deck_name=args.deck_name)
-        notes = flashcard_maker.create(phrase, new_log_entry=False)
+        notes = flashcard_maker.add_notes(phrase, translations)
         if notes is not None:
             now = datetime.now()
             phrase.share_date = now
@@ -37,19 +68,72 @@ def main():
             # Something went wrong while trying to translate this.
             return None
 
-    with open(args.filepath) as file:
+    # Once a line fails to translate, the cursor stays just before it (like
+    # the server's SyncCursor), so that the next run tries it again. Lines
+    # after it that did get flashcarded are on the server by then, so the
+    # next run skips them.
+    stuck = False
+
+    def commit(lines, end):
+        # Translate and flashcard a chunk of (line, where it starts, hash of
+        # everything before it), send them to Anki and the server, then
+        # remember that we got up to `end`. Returns whether everything was
+        # posted back, so it's safe to carry on.
+        nonlocal stuck
+        if lines:
+            german_lines = [german for german, _, _ in lines]
+            log(f'Translating {len(german_lines)} lines...')
+            batch = flashcard_maker.translator.translate_many(german_lines)
+            phrases = [
+                flashcard(german, translations)
+                for german, translations in zip(german_lines, batch)]
+            translated = [phrase for phrase in phrases if phrase is not None]
+            if not flashcard_maker.update_anki():
+                log("Couldn't import into Anki - stopping here, so the next "
+                    "run starts from this chunk again.")
+                return False
+            failed = server.post_phrases(translated)
+            if failed:
+                log(f"Couldn't post {len(failed)} phrases back - stopping "
+                    f"here, so the next run starts from this chunk again.")
+                return False
+            for (german, start, before), phrase in zip(lines, phrases):
+                if phrase is None and not stuck:
+                    log(f"Couldn't translate '{german}' - the next run will "
+                        f"start from it again.")
+                    cursor.set(args.filepath, args.deck_name, start, before)
+                    stuck = True
+        if not stuck:
+            cursor.set(args.filepath, args.deck_name, end, hasher)
+        return True
+
+    with open(args.filepath, 'rb') as file:
         log('Reading file...')
-        german_lines = [line.strip() for line in file.readlines()]
-        german_lines = [line for line in german_lines if line != '']
-        log('Creating phrases from lines...')
-        phrases = [translate(german) for german in german_lines]
-        translated = [phrase for phrase in phrases if phrase is not None]
-        log('\nPhrases translated and flashcarded!')
-        flashcard_maker.update_anki()
-        server.post_phrases(translated)
+        file.seek(offset)
+        chunk = []
+        # Read the file a line at a time, rather than all at once.
+        for raw_line in file:
+            start, before = offset, hasher.copy()
+            hasher.update(raw_line)
+            offset += len(raw_line)
+            german = raw_line.decode('utf-8').strip()
+            if german == '':
+                continue
+            key = TranslationCache.normalise(german)
+            if key in seen:
+                log(f'Already have \'{german}\' - skipping...')
+                continue
+            seen.add(key)
+            chunk.append((german, start, before))
+            if len(chunk) >= args.chunk_size:
+                if not commit(chunk, offset):
+                    return
+                chunk = []
+        if commit(chunk, offset) and not stuck:
+            log('\nPhrases translated and flashcarded!')
 
 
-def configure_args(default_deck_name: str):
+def configure_args(default_deck_name: str, argv=None):
     description = 'Generate Anki flashcards from a file of German words'
     parser = argparse.ArgumentParser(description=description)
     filepath_help = 'Relative path to the file containing the German words.'
@@ -59,8 +143,27 @@ def configure_args(default_deck_name: str):
     parser.add_argument(
         'deck_name', help=deck_name_help, type=str, nargs='?',
         default=default_deck_name)
-    args = parser.parse_args()
+    chunk_size_help = (
+        'How many new phrases to translate before sending them to Anki and '
+        'the server, and remembering how far through the file we got.')
+    parser.add_argument(
+        '--chunk-size', type=int, default=100, help=chunk_size_help)
+    restart_help = (
+        'Start from the top of the file, rather than where the last run '
+        'got to.')
+    parser.add_argument('--restart', action='store_true', help=restart_help)
+    include_known_help = (
+        'Flashcard phrases even if they\'re already on the server.')
+    parser.add_argument(
+        '--include-known', action='store_true', help=include_known_help)
+    add_cache_args(parser)
+    add_log_args(parser)
+    add_metrics_args(parser)
+    args = parser.parse_args(argv)
+    if args.verbose:
+        set_level(DEBUG)
     return args
 
 
-main()
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,14 @@
+import argparse
 from datetime import datetime
+from typing import Optional
 
 from main.FlashcardMaker import FlashcardMaker
 from main.server.Server import Server
-from main.logs.log import log
+from main.logs.log import DEBUG, add_log_args, log, set_level
+from main.Metrics import Metrics
+from main.SharedResources import SharedResources
 from main.translation.Translation import Translation
-from main.utils import open_anki, close_anki
+from main.utils import close_anki, add_cache_args, add_metrics_args
 
 
 # Temporary design: have a python script that we set the OS to run every x
@@ -13,38 +17,111 @@ from main.utils import open_anki, close_anki
 # Should check Anki running and if not open it.
 
 
-def main():
+def main(argv=None):
+    args = configure_args(argv)
+    metrics_dir = None if args.no_metrics else args.metrics_dir
+    with Metrics.shared().run(
+            'flashcards_from_server', metrics_dir, args.profile):
+        check_for_phrases(args)
+
+
+def check_for_phrases(args, server=None, resources=None):
+    # Load the dictionary, etc. once, rather than once per user. Nothing is
+    # loaded (and Anki isn't opened) until it's needed, so if there are no
+    # new phrases, we don't do any of it.
+    if resources is None:
+        resources = SharedResources(
+            use_cache=not args.no_cache, refresh_cache=args.refresh)
     try:
         log('Flashcard maker booting up...', new_entry=True)
-        already_open = open_anki()
-        log('Anki already open' if already_open else 'Opened Anki...')
-        server = Server()
+        if server is None:
+            server = Server()
+        # Find out if there's anything to do before doing anything else.
+        pending = {}
         for user_name in server.authorizer.users:
-            phrases = server.get_phrases(owner=user_name)
+            phrases = server.get_phrases(
+                owner=user_name, incremental=not args.full_sync)
             if len(phrases) > 0:
-                flashcard_maker = FlashcardMaker(user_name)
-                translated = translate_phrases(flashcard_maker, phrases)
-                flashcard_maker.update_anki()
-                server.post_phrases(translated)
-            log(f'Successfully checked for new flashcards!')
-        log('Closing Anki...')
-        close_anki()
+                pending[user_name] = phrases
+        if not pending:
+            log('No new phrases!')
+        for user_name, phrases in pending.items():
+            flashcard_maker = FlashcardMaker(user_name, resources)
+            translated = translate_phrases(
+                flashcard_maker, phrases, args.concurrency,
+                args.per_host_rate or None)
+            if not flashcard_maker.update_anki():
+                # Don't mark them as flashcarded, so they're tried again.
+                translated = []
+            failed = set(map(id, server.post_phrases(translated)))
+            # Next time, only ask for phrases after these (bar any we
+            # couldn't translate or post back, which we'll try again).
+            done = [
+                phrase for phrase in translated if id(phrase) not in failed]
+            server.advance_cursor(user_name, phrases, done)
+        log(f'Successfully checked for new flashcards!')
     except Exception as e:
         log(str(e))
+    if resources.anki_in_use:
         log('Closing Anki...')
         close_anki()
 
 
+def configure_args(argv=None):
+    description = 'Generate Anki flashcards from phrases on the server'
+    parser = argparse.ArgumentParser(description=description)
+    add_cache_args(parser)
+    add_log_args(parser)
+    add_metrics_args(parser)
+    full_sync_help = (
+        'Ask the server for every unflashcarded phrase, rather than only '
+        'those since the last run.')
+    parser.add_argument(
+        '--full-sync', action='store_true', help=full_sync_help)
+    concurrency_help = 'How many phrases to translate at once.'
+    parser.add_argument(
+        '--concurrency', type=int, default=4, help=concurrency_help)
+    per_host_rate_help = (
+        'Most requests a second to send to each of Linguee, verbformen and '
+        'DeepL, or 0 for no limit. Linguee starts refusing requests if this '
+        'is too high.')
+    parser.add_argument(
+        '--per-host-rate', type=float, default=1.0, help=per_host_rate_help)
+    args = parser.parse_args(argv)
+    if args.verbose:
+        set_level(DEBUG)
+    return args
+
 
-def translate_phrases(flashcard_maker, phrases):
+def translate_phrases(
+        flashcard_maker, phrases, max_concurrency: int = 4,
+        per_host_rate: Optional[float] = 1.0):
     # N.B. Unflashcarded phrases may already be translated (e.g. if
     # another user already shared this phrase and thus it was translated
     # then, or if making the flashcard just failed earlier for some
     # reason).
+    # Auto-translate everything that needs it in one batch, so we can wait
+    # on several phrases' requests at once.
+    to_translate = [
+        phrase for phrase in phrases
+        if not phrase.translations and phrase.english == '']
+    batch = flashcard_maker.translator.translate_many(
+        [phrase.german for phrase in to_translate], max_concurrency,
+        per_host_rate)
+    auto_translations = dict(zip(map(id, to_translate), batch))
+    # Check what's already in all the decks we'll add to in one go - if
+    # there's nothing to add, we don't need Anki at all.
+    deck_names = [
+        phrase.deck_name for phrase in phrases
+        if phrase.translations or phrase.english != ''
+        or auto_translations.get(id(phrase)) is not None]
+    if deck_names:
+        flashcard_maker.preflight(deck_names)
     translated = []
     for phrase in phrases:
         try:
-            success = translate_phrase(phrase, flashcard_maker)
+            success = translate_phrase(
+                phrase, flashcard_maker, auto_translations.get(id(phrase)))
             if success:
                 translated.append(phrase)
         except Exception as exception:
@@ -55,22 +132,21 @@ def translate_phrases(flashcard_maker, phrases):
     return translated
 
 
-def translate_phrase(phrase, flashcard_maker):
+def translate_phrase(phrase, flashcard_maker, auto_translations=None):
     now = datetime.now()
     if phrase.translations:
         log(f'Translations exist for {phrase.german} - flashcarding...')
         # Has already been translated, so just needs flashcarding.
         for translation in phrase.translations:
-            flashcard_maker.note_taker.add_note(
-                translation, phrase.deck_name)
+            flashcard_maker.add_note(translation, phrase.deck_name)
         phrase.flashcard_date = now
         # Always translates successfully.
         return True
     else:
         # Needs translating and flashcarding
         if phrase.english == '':
-            log(f'Auto-translating {phrase.german} then flashcarding...')
-            notes = flashcard_maker.create(phrase, new_log_entry=False)
+            log(f'Auto-translated {phrase.german} - flashcarding...')
+            notes = flashcard_maker.add_notes(phrase, auto_translations)
             # If `notes` is not None, this was successfully translated
             translated = notes is not None
         else:
@@ -79,8 +155,7 @@ def translate_phrase(phrase, flashcard_maker):
                 german=phrase.german,
                 english=phrase.english)
             log(f'Converting given translation to note...')
-            flashcard_maker.note_taker.add_note(
-                translation, phrase.deck_name)
+            flashcard_maker.add_note(translation, phrase.deck_name)
             translated = True
             phrase.translations = [translation]
         # If we actually did translate this phrase, note this down.
@@ -94,4 +169,5 @@ def translate_phrase(phrase, flashcard_maker):
         return translated
 
 
-main()
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Tuple
+
+from main.utils import cache_dir
+
+
+class FileCursor:
+    # Remembers how far through each file (and into which deck) we've got,
+    # as a byte offset, so that flashcards_from_file can carry on from the
+    # last chunk it finished. Alongside the offset is a hash of everything
+    # before it, so that if the file's been changed before that point, we
+    # start again rather than skipping the wrong lines.
+    def __init__(self, path: str = None):
+        if path is None:
+            path = f'{cache_dir()}/file_cursors.db'
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS cursors ('
+                'file TEXT, deck_name TEXT, offset INTEGER, digest TEXT, '
+                'PRIMARY KEY (file, deck_name))')
+
+    def get(self, file_path: str, deck_name: str) -> Tuple[int, Any]:
+        # Returns where to carry on from, and the hash of everything before
+        # it, to keep updating as we read on. That's the start of the file
+        # if we haven't read it before or it's changed since.
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT offset, digest FROM cursors '
+                'WHERE file = ? AND deck_name = ?',
+                (self.key(file_path), deck_name)).fetchone()
+        if row is None:
+            return 0, hashlib.sha256()
+        offset, digest = row
+        hasher = hashlib.sha256()
+        remaining = offset
+        with open(file_path, 'rb') as file:
+            while remaining > 0:
+                block = file.read(min(remaining, 1 << 20))
+                if not block:
+                    break
+                hasher.update(block)
+                remaining -= len(block)
+        if remaining > 0 or hasher.hexdigest() != digest:
+            return 0, hashlib.sha256()
+        return offset, hasher
+
+    def set(
+            self, file_path: str, deck_name: str, offset: int, hasher):
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO cursors VALUES (?, ?, ?, ?)',
+                (self.key(file_path), deck_name, offset, hasher.hexdigest()))
+
+    def reset(self, file_path: str, deck_name: str):
+        with self.lock, self.connection:
+            self.connection.execute(
+                'DELETE FROM cursors WHERE file = ? AND deck_name = ?',
+                (self.key(file_path), deck_name))
+
+    @staticmethod
+    def key(file_path: str) -> str:
+        return str(Path(file_path).resolve())
+
+    def close(self):
+        self.connection.close()
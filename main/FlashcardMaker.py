@@ -1,37 +1,148 @@
 import os.path
+from typing import List
 
-from main.anki.Connector import Connector
 from main.anki.NoteTaker import NoteTaker
 from main.logs.log import log
+from main.Metrics import Metrics
 from main.server.Phrase import Phrase
+from main.SharedResources import SharedResources
+from main.translation.Translation import Translation
 from main.translation.Translator import Translator
 
 
 class FlashcardMaker:
-    def __init__(self, user_name: str):
+    def __init__(self, user_name: str, resources: SharedResources = None):
         self.user_name = user_name
-        self.translator = Translator(user_name)
-        self.note_taker = NoteTaker()
-        self.connector = Connector()
+        # Only the DeepL client is specific to this user - everything else
+        # can be shared with other users' FlashcardMakers.
+        self.resources = \
+            resources if resources is not None else SharedResources()
+        self.translator = Translator(
+            user_name,
+            apple_dict=self.resources.apple_dict,
+            cache=self.resources.translation_cache,
+            page_cache=self.resources.page_cache,
+            conjugations=self.resources.conjugations,
+            authorizer=self.resources.authorizer)
+        self.note_taker = NoteTaker(model=self.resources.model)
+        # The (english, german) fields of the notes already in each deck we've
+        # checked, so we don't add the same note twice.
+        self.existing_notes = {}
+        self.skipped = 0
+
+    @property
+    def connector(self):
+        return self.resources.connector
 
     def create(self, phrase: Phrase, new_log_entry=True):
         translations = self.translator.translate(phrase.german, new_log_entry)
+        return self.add_notes(phrase, translations)
+
+    def add_notes(self, phrase: Phrase, translations: List[Translation]):
+        # `translations` should come from the translator - if they're None,
+        # the phrase couldn't be translated, so there's nothing to add.
         if translations is not None:
             phrase.translations = translations
             notes = [
-                self.note_taker.add_note(translation, phrase.deck_name)
+                self.add_note(translation, phrase.deck_name)
                 for translation in phrase.translations]
-            return notes
+            return [note for note in notes if note is not None]
         else:
             return None
 
-    def update_anki(self):
+    def add_note(self, translation: Translation, deck_name: str):
+        # Returns None, rather than a note, if the deck already has this note.
+        self.preflight([deck_name])
+        key = self.note_key(NoteTaker.get_fields(translation))
+        if key in self.existing_notes[deck_name]:
+            log(f'Deck \'{deck_name}\' already has a note for '
+                f'{translation.german} - skipping...')
+            self.skipped += 1
+            return None
+        self.existing_notes[deck_name].add(key)
+        return self.note_taker.add_note(translation, deck_name)
+
+    @Metrics.shared().timed('anki.preflight')
+    def preflight(self, deck_names: List[str]):
+        # Find out what notes are already in each deck we haven't checked
+        # yet, using one request to find the notes in all of the decks and
+        # one more to get all their fields.
+        deck_names = sorted(
+            set(deck_names).difference(self.existing_notes))
+        if not deck_names:
+            return
+        log(f'Checking {deck_names} for existing notes...')
+        try:
+            with self.connector.batch() as batch:
+                for deck_name in deck_names:
+                    batch.request('findNotes', query=f'deck:"{deck_name}"')
+            note_ids = [ids or [] for ids in batch.results]
+            all_ids = [id for ids in note_ids for id in ids]
+            notes_info = self.connector.unwrap(
+                self.connector.request('notesInfo', notes=all_ids)) \
+                if all_ids else []
+        except Exception as e:
+            log(f'Couldn\'t check for existing notes: {str(e)}')
+            note_ids = [[] for _ in deck_names]
+            notes_info = []
+        keys = {
+            info['noteId']: self.note_key([
+                info['fields'][field]['value']
+                for field in ['english', 'german']])
+            for info in notes_info or []
+            if info and {'english', 'german'}.issubset(info['fields'])}
+        for deck_name, ids in zip(deck_names, note_ids):
+            self.existing_notes[deck_name] = {
+                keys[id] for id in ids if id in keys}
+
+    @staticmethod
+    def note_key(fields: List[str]):
+        # Notes count as the same if their english and german are.
+        return fields[0], fields[1]
+
+    @Metrics.shared().timed('anki.update')
+    def update_anki(self) -> bool:
+        # Returns whether the new notes made it into Anki (or there weren't
+        # any), so that phrases are only marked as flashcarded if they did.
         log(f'Updating Anki...')
-        for deck_name in self.note_taker.decks:
-            deck_apkg = self.note_taker.output_deck(deck_name)
-            self.connector.request('importPackage', path=deck_apkg)
+        if self.skipped > 0:
+            log(f'Skipped {self.skipped} note(s) already in Anki...')
+        # Import every deck with new notes as one package, so Anki only has
+        # to import (and reload its collection) once.
+        deck_names = self.note_taker.touched_deck_names()
+        if not deck_names:
+            log('No new notes - leaving Anki alone...')
+            return True
+        deck_apkg = self.note_taker.output_decks(deck_names)
+        # Import and sync in a single request to AnkiConnect.
+        try:
+            connector = self.connector
+        except RuntimeError:
+            # Anki didn't open (and we've logged why) - treat it like a
+            # failed import.
+            connector = None
+            imported = synced = False
+        try:
+            if connector is not None:
+                with connector.batch() as batch:
+                    batch.request('importPackage', path=deck_apkg)
+                    batch.request('sync')
+                imported, synced = batch.succeeded
+        finally:
             # Tidy up by deleting the .apkg file immediately
             if os.path.exists(deck_apkg):
                 os.remove(deck_apkg)
-        self.connector.request('sync')
+            # Start afresh, so that calling this again (e.g. after the next
+            # chunk of phrases) only imports the notes added since. If the
+            # import failed, the phrases will be tried again next time.
+            self.note_taker = NoteTaker(model=self.note_taker.model)
+            self.skipped = 0
+        if not imported:
+            log(f'Couldn\'t import {deck_names} into Anki...')
+            # Those notes aren't there after all, so check again next time.
+            for deck_name in deck_names:
+                self.existing_notes.pop(deck_name, None)
+        elif not synced:
+            log('Imported into Anki, but couldn\'t sync...')
+        return imported
 
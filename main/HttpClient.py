@@ -0,0 +1,129 @@
+import threading
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from main.Metrics import Metrics
+
+
+class HttpClient:
+    # A requests session that keeps connections to each host alive and
+    # pooled, so that we're not doing a new TCP (and TLS) handshake for every
+    # request. Every request gets a timeout, and requests that fail to
+    # connect are retried with exponential backoff. Idempotent requests that
+    # get a 502/503/504 back are only retried for hosts where that's safe
+    # (see retry_on_status) - for Linguee, a 503 means we're being
+    # throttled, and retrying straight away (behind the RateLimiter's back)
+    # only makes it worse. Use HttpClient.shared() rather than making new
+    # ones, so that the whole process shares the same connections.
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(
+            self, timeout=(5, 30), retries: int = 3,
+            backoff_factor: float = 0.5, pool_size: int = 10):
+        # Timeouts are (connect, read) in seconds, as for requests.
+        self.timeout = timeout
+        connect_retry = CountingRetry(
+            total=retries, connect=retries, read=0,
+            backoff_factor=backoff_factor,
+            # urllib3 would otherwise retry any 503 with a Retry-After
+            # header, whatever the host.
+            respect_retry_after_header=False)
+        status_retry = CountingRetry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(502, 503, 504),
+            # Not POST - a 5xx doesn't tell us whether it was handled.
+            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+            # Give back the last response rather than raising, since callers
+            # check the status code themselves.
+            raise_on_status=False)
+        self.adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size,
+            max_retries=connect_retry)
+        self.status_adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size,
+            max_retries=status_retry)
+        self.session = requests.Session()
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+
+    @classmethod
+    def shared(cls):
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def retry_on_status(self, base_url: str):
+        # Also retry idempotent (e.g. GET, but not POST) requests under
+        # base_url that get a 502/503/504, e.g. for the phrase server, which
+        # only sends those when it's briefly unavailable. Call this when
+        # setting up, rather than while other threads are sending requests.
+        prefix = base_url.rstrip('/') + '/'
+        if self.session.adapters.get(prefix) is not self.status_adapter:
+            self.session.mount(prefix, self.status_adapter)
+
+    def request(self, method: str, url: str, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        metrics = Metrics.shared()
+        if not metrics.enabled:
+            return self.session.request(method, url, **kwargs)
+        host = urlparse(url).netloc
+        try:
+            with metrics.span('http', host=host):
+                response = self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            metrics.count('http_errors', host=host)
+            raise
+        metrics.count('http_requests', host=host)
+        # Don't read streamed bodies just to count them.
+        if kwargs.get('stream', False):
+            size = int(response.headers.get('Content-Length', 0))
+        else:
+            size = len(response.content)
+        metrics.count('http_response_bytes', size, host=host)
+        if response.status_code >= 500:
+            # For Linguee, this means we're being throttled. Any responses
+            # that were retried have already been counted by CountingRetry.
+            metrics.count(
+                'http_5xx', host=host, status=response.status_code)
+        return response
+
+    def get(self, url: str, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+class CountingRetry(Retry):
+    # HttpClient.request only sees the last response, so count each 5xx
+    # that's retried here, as it happens.
+    def increment(
+            self, method=None, url=None, response=None, error=None,
+            _pool=None, _stacktrace=None):
+        # Raises if we've run out of retries, in which case the response is
+        # the one HttpClient.request gets back (and counts) instead.
+        retry = super().increment(
+            method, url, response, error, _pool, _stacktrace)
+        if response is not None and response.status >= 500 \
+                and _pool is not None:
+            Metrics.shared().count(
+                'http_5xx', host=pool_host(_pool), status=response.status)
+        return retry
+
+
+def pool_host(pool) -> str:
+    # The host as it appears in the URL (as HttpClient.request labels it),
+    # i.e. with the port only if it isn't the scheme's default.
+    default_port = {'http': 80, 'https': 443}.get(pool.scheme)
+    if pool.port is None or pool.port == default_port:
+        return pool.host
+    return f'{pool.host}:{pool.port}'
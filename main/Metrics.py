@@ -0,0 +1,212 @@
+import cProfile
+import functools
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# Shared by every span while metrics are off, so they cost next to nothing.
+_DISABLED = nullcontext()
+
+
+class Metrics:
+    # Times each stage of a run (spans) and counts things like HTTP requests,
+    # bytes and cache hits, optionally by label (e.g. host). Everything is
+    # off until enabled, in which case span() hands back a shared do-nothing
+    # context manager and count() returns straight away. Use
+    # Metrics.shared() so that the whole process records into the same one.
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, enabled: bool = False, keep_samples: bool = False):
+        self.enabled = enabled
+        # If True, every span's duration is kept, so that the summary can
+        # give percentiles (e.g. for the load test). Off by default, since a
+        # normal run doesn't need them.
+        self.keep_samples = keep_samples
+        self.lock = threading.Lock()
+        # (name, labels) -> [calls, total seconds, longest call]
+        self.spans: Dict[Tuple[str, tuple], list] = {}
+        # (name, labels) -> every duration, if keep_samples is True
+        self.samples: Dict[Tuple[str, tuple], List[float]] = {}
+        # (name, labels) -> total
+        self.counters: Dict[Tuple[str, tuple], float] = {}
+        self.started = time.time()
+
+    @classmethod
+    def shared(cls):
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def span(self, name: str, **labels):
+        if not self.enabled:
+            return _DISABLED
+        return Span(self, (name, tuple(sorted(labels.items()))))
+
+    def timed(self, name: str):
+        # Decorator version of span.
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with self.span(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def record(self, key: Tuple[str, tuple], seconds: float):
+        with self.lock:
+            span = self.spans.setdefault(key, [0, 0.0, 0.0])
+            span[0] += 1
+            span[1] += seconds
+            span[2] = max(span[2], seconds)
+            if self.keep_samples:
+                self.samples.setdefault(key, []).append(seconds)
+
+    def count(self, name: str, value: float = 1, **labels):
+        if not self.enabled:
+            return
+        key = name, tuple(sorted(labels.items()))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def reset(self):
+        with self.lock:
+            self.spans.clear()
+            self.samples.clear()
+            self.counters.clear()
+            self.started = time.time()
+
+    def summary(self, job: str):
+        with self.lock:
+            spans = []
+            for key, (calls, seconds, longest) in sorted(self.spans.items()):
+                name, labels = key
+                span = {
+                    'name': name, 'labels': dict(labels), 'calls': calls,
+                    'seconds': seconds, 'max_seconds': longest}
+                if key in self.samples:
+                    span.update(percentiles(self.samples[key]))
+                spans.append(span)
+            counters = [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in sorted(self.counters.items())]
+        return {
+            'job': job, 'started': self.started, 'finished': time.time(),
+            'spans': spans, 'counters': counters}
+
+    def prometheus(self, job: str) -> str:
+        # In the textfile collector's format. Each file describes one run, so
+        # everything is a gauge.
+        summary = self.summary(job)
+        lines = []
+
+        def metric(name, help_text, samples):
+            lines.append(f'# HELP flashcards_{name} {help_text}')
+            lines.append(f'# TYPE flashcards_{name} gauge')
+            for labels, value in samples:
+                labels = {'job': job, **labels}
+                label_text = ','.join(
+                    f'{key}="{escape_label(str(value))}"'
+                    for key, value in labels.items())
+                lines.append(f'flashcards_{name}{{{label_text}}} {value}')
+
+        metric(
+            'last_run_timestamp_seconds', 'When the last run finished.',
+            [({}, summary['finished'])])
+        metric(
+            'span_seconds', 'Total time spent in each stage.',
+            [({'span': span['name'], **span['labels']}, span['seconds'])
+             for span in summary['spans']])
+        metric(
+            'span_max_seconds', 'Longest single call of each stage.',
+            [({'span': span['name'], **span['labels']}, span['max_seconds'])
+             for span in summary['spans']])
+        metric(
+            'span_calls', 'Number of calls of each stage.',
+            [({'span': span['name'], **span['labels']}, span['calls'])
+             for span in summary['spans']])
+        names = sorted({counter['name'] for counter in summary['counters']})
+        for name in names:
+            metric(
+                metric_name(name), f'Number of {name.replace("_", " ")}.',
+                [(counter['labels'], counter['value'])
+                 for counter in summary['counters']
+                 if counter['name'] == name])
+        return '\n'.join(lines) + '\n'
+
+    def write(self, directory: str, job: str):
+        # Writes {job}.json and {job}.prom. Each is written to a temporary
+        # file then renamed, so the node exporter never sees half a file.
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        summary = json.dumps(self.summary(job), indent=2)
+        write_atomically(Path(directory, f'{job}.json'), summary)
+        write_atomically(Path(directory, f'{job}.prom'), self.prometheus(job))
+
+    @contextmanager
+    def run(
+            self, job: str, directory: Optional[str] = None,
+            profile: Optional[str] = None):
+        # Wraps a whole run: records into a fresh set of metrics and writes
+        # them out to `directory` at the end (if given), and writes cProfile
+        # stats to `profile` (if given).
+        self.reset()
+        self.enabled = directory is not None
+        profiler = cProfile.Profile() if profile is not None else None
+        if profiler is not None:
+            profiler.enable()
+        try:
+            with self.span('run'):
+                yield self
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                Path(profile).parent.mkdir(parents=True, exist_ok=True)
+                profiler.dump_stats(profile)
+            if directory is not None:
+                self.write(directory, job)
+            self.enabled = False
+
+
+class Span:
+    __slots__ = ('metrics', 'key', 'start')
+
+    def __init__(self, metrics: Metrics, key: Tuple[str, tuple]):
+        self.metrics = metrics
+        self.key = key
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.record(self.key, time.perf_counter() - self.start)
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    samples = sorted(samples)
+    return {
+        f'p{percent}_seconds':
+            samples[min(len(samples) - 1, len(samples) * percent // 100)]
+        for percent in (50, 90, 99)}
+
+
+def metric_name(name: str) -> str:
+    return re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+
+def escape_label(value: str) -> str:
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def write_atomically(path: Path, text: str):
+    temporary = path.with_name(f'.{path.name}.tmp')
+    temporary.write_text(text, encoding='utf-8')
+    os.replace(temporary, path)
@@ -0,0 +1,24 @@
+import threading
+import time
+import urllib.parse
+
+
+class RateLimiter:
+    # Spaces out requests so that no host gets more than `rate` requests a
+    # second, however many threads are sending them. A rate of None means
+    # there's no limit.
+    def __init__(self, rate: float = None):
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.next_slots = {}
+
+    def wait(self, url: str):
+        if self.rate is None:
+            return
+        host = urllib.parse.urlsplit(url).netloc or url
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slots.get(host, now))
+            self.next_slots[host] = slot + 1 / self.rate
+        if slot > now:
+            time.sleep(slot - now)
@@ -0,0 +1,79 @@
+from functools import cached_property
+
+from main.anki.Connector import Connector
+from main.anki.NoteTaker import NoteTaker
+from main.logs.log import log
+from main.translation.ConjugationIndex import ConjugationIndex
+from main.translation.PageCache import PageCache
+from main.translation.TranslationCache import TranslationCache
+from main.translation.Translator import Translator
+from main.utils import open_anki
+
+
+class SharedResources:
+    # Things that are slow to set up but are the same for every user: the
+    # Apple dictionary, the translation and page caches, the conjugation
+    # index, the Anki note model and the AnkiConnect connection. Create one
+    # of these per run and hand it to every FlashcardMaker, so each is only
+    # set up once (and only if it's actually needed).
+    def __init__(
+            self, use_cache: bool = True, refresh_cache: bool = False,
+            authorizer=None):
+        self.use_cache = use_cache
+        self.refresh_cache = refresh_cache
+        # If None, each Translator loads the real credentials.
+        self.authorizer = authorizer
+        # Why Anki didn't answer, if it didn't - so we only wait for it once.
+        self.anki_error = None
+
+    @cached_property
+    def apple_dict(self):
+        return Translator.load_apple_dict()
+
+    @cached_property
+    def translation_cache(self):
+        if self.use_cache:
+            return TranslationCache(refresh=self.refresh_cache)
+        else:
+            return None
+
+    @cached_property
+    def page_cache(self):
+        if self.use_cache:
+            return PageCache()
+        else:
+            return None
+
+    @cached_property
+    def conjugations(self):
+        if not self.use_cache:
+            return None
+        conjugations = ConjugationIndex()
+        if len(conjugations) == 0:
+            # Start off with whatever verbformen pages we've already fetched.
+            conjugations.import_pages(self.page_cache)
+        return conjugations
+
+    @cached_property
+    def model(self):
+        return NoteTaker.default_model(NoteTaker.DEFAULT_DECK_NAME)
+
+    @cached_property
+    def connector(self):
+        # We only open Anki once something actually needs to talk to it.
+        if self.anki_error is not None:
+            raise self.anki_error
+        try:
+            already_open = open_anki()
+        except RuntimeError as e:
+            log(str(e))
+            self.anki_error = e
+            raise
+        log('Anki already open...' if already_open else 'Opened Anki...')
+        return Connector()
+
+    @property
+    def anki_in_use(self):
+        # Whether we've opened (or connected to) Anki during this run. If we
+        # tried and it never answered, we may still have launched it.
+        return 'connector' in self.__dict__ or self.anki_error is not None
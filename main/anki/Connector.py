@@ -1,14 +1,26 @@
 import requests
 
+from main.HttpClient import HttpClient
 from main.logs.log import log
+from main.Metrics import Metrics
+from main.utils import ANKI_CONNECT_URL
 
 
 class Connector:
-    def __init__(self):
+    def __init__(
+            self, http: HttpClient = None, timeout=(5, 120),
+            url: str = ANKI_CONNECT_URL):
         # Eventually server will need to log in to several people's Anki
         # accounts, so an Authorizer will be needed. For now, it isn't.
         # (Not sure if this comment applies to NoteTaker or Connector!)
         # (Nor sure if this is even possible! :((( Sad times)
+        self.url = url
+        self.http = http if http is not None else HttpClient.shared()
+        # Every AnkiConnect action is a POST, so a 5xx isn't retried - Anki
+        # may have imported the package before failing.
+        # Importing a big package can take Anki a while, so the read timeout
+        # is longer than for other hosts.
+        self.timeout = timeout
         self.version = 4  # Minimum possible - will update in a sec hopefully.
         self.initialised = False
         try:
@@ -30,5 +42,85 @@ class Connector:
 
     def request(self, action: str, **params):
         data = {'action': action, 'params': params, 'version': self.version}
-        response = requests.post('http://localhost:8765', json=data)
-        return response.json()
\ No newline at end of file
+        actions = action
+        if action == 'multi':
+            actions = '+'.join(item['action'] for item in params['actions'])
+        with Metrics.shared().span('anki.connect', action=actions):
+            response = self.http.post(
+                self.url, json=data, timeout=self.timeout)
+        return response.json()
+
+    def batch(self):
+        # Use as `with connector.batch() as batch:`, calling batch.request as
+        # you would connector.request. The actions are sent as one AnkiConnect
+        # 'multi' request when the block ends, and their results are then in
+        # batch.results, in the same order, and whether each succeeded is in
+        # batch.succeeded.
+        return ConnectorBatch(self)
+
+    @staticmethod
+    def unwrap(response):
+        # From version 5, AnkiConnect gives {'result': ..., 'error': ...}
+        # rather than just the result.
+        if isinstance(response, dict) and set(response) == {'result', 'error'}:
+            if response['error'] is not None:
+                log(f'AnkiConnect error: {response["error"]}')
+            return response['result']
+        return response
+
+    @staticmethod
+    def failed(response) -> bool:
+        # Whether a (not yet unwrapped) response is an error. Before version
+        # 5, there's no way to tell.
+        return isinstance(response, dict) \
+            and set(response) == {'result', 'error'} \
+            and response['error'] is not None
+
+
+class ConnectorBatch:
+    def __init__(self, connector: Connector):
+        self.connector = connector
+        self.actions = []
+        self.results = None
+        self.succeeded = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Don't send anything if the block raised.
+        if exc_type is None:
+            self.flush()
+
+    def request(self, action: str, **params):
+        # Returns the index of this action's result in self.results.
+        self.actions.append({
+            'action': action, 'params': params,
+            'version': self.connector.version})
+        return len(self.actions) - 1
+
+    def flush(self):
+        # Returns whether each action succeeded. If the 'multi' request itself
+        # failed, none of them did, and all their results are None.
+        actions, self.actions = self.actions, []
+        if not actions:
+            self.results, self.succeeded = [], []
+            return self.succeeded
+        try:
+            response = self.connector.request('multi', actions=actions)
+        except requests.RequestException as e:
+            log(f'Error sending {len(actions)} action(s) to AnkiConnect: '
+                f'{str(e)}')
+            response = None
+        responses = Connector.unwrap(response)
+        if not isinstance(responses, list) or len(responses) != len(actions):
+            log(f'AnkiConnect didn\'t perform any of {len(actions)} '
+                f'action(s)')
+            self.results = [None] * len(actions)
+            self.succeeded = [False] * len(actions)
+        else:
+            self.succeeded = [
+                not Connector.failed(response) for response in responses]
+            self.results = [
+                Connector.unwrap(response) for response in responses]
+        return self.succeeded
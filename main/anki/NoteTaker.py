@@ -1,25 +1,30 @@
 from datetime import datetime
 from pathlib import Path
+from typing import List
 
 import genanki
 
+from main.Metrics import Metrics
 from main.translation.Translation import Translation
 from main.utils import project_root, anki_id
 
 
 class NoteTaker:
-    def __init__(self):
+    DEFAULT_DECK_NAME = 'Fluency Lube'
+
+    def __init__(self, model: genanki.Model = None):
         # Eventually server will need to log in to several people's Anki
         # accounts, so an Authorizer will be needed. For now, it isn't.
         # (Not sure if this comment applies to NoteTaker or Connector!)
         # (Nor sure if this is even possible! :((( Sad times)
-        self.default_deck_name = 'Fluency Lube'
+        self.default_deck_name = self.DEFAULT_DECK_NAME
         default_deck_id = anki_id(self.default_deck_name)
         default_deck = genanki.Deck(default_deck_id, self.default_deck_name)
         self.decks = {
             self.default_deck_name: default_deck}
 
-        self.model = self.default_model(self.default_deck_name)
+        self.model = model if model is not None \
+            else self.default_model(self.default_deck_name)
 
     def add_note(self, translation: Translation, deck_name: str = None):
         fields = self.get_fields(translation)
@@ -29,15 +34,29 @@ class NoteTaker:
         return note
 
     def output_deck(self, deck_name: str):
+        return self.output_decks([deck_name])
+
+    @Metrics.shared().timed('anki.output_decks')
+    def output_decks(self, deck_names: List[str]):
+        # Write all the given decks to a single package, so Anki can import
+        # them in one go.
         now = datetime.now().strftime('%Y%m%d_%H%M%S')
-        deck_file_name = deck_name.replace(' ', '_')
+        if len(deck_names) == 1:
+            deck_file_name = deck_names[0].replace(' ', '_')
+        else:
+            deck_file_name = f'{len(deck_names)}_decks'
         relative_path = f'main/anki/output/{now}_{deck_file_name}.apkg'
         absolute_path = f'{project_root()}/{relative_path}'
         Path(absolute_path).parent.mkdir(parents=True, exist_ok=True)
-        deck = self.get_deck(deck_name, create_if_needed=False)
-        genanki.Package(deck).write_to_file(absolute_path)
+        decks = [
+            self.get_deck(deck_name, create_if_needed=False)
+            for deck_name in deck_names]
+        genanki.Package(decks).write_to_file(absolute_path)
         return absolute_path
 
+    def touched_deck_names(self):
+        return [name for name, deck in self.decks.items() if deck.notes]
+
     @staticmethod
     def get_fields(translation: Translation):
         german = translation.german
@@ -0,0 +1,71 @@
+import atexit
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+
+class LogWriter:
+    # Keeps the day's log file open and buffered, rather than opening,
+    # writing and closing it for every line. A background thread flushes the
+    # buffer every `flush_interval` seconds, and it's flushed again when the
+    # process exits. At midnight it moves on to the next day's file.
+    def __init__(
+            self, directory: str, flush_interval: float = 1.0,
+            buffer_size: int = 64 * 1024):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.flush_interval = flush_interval
+        self.buffer_size = buffer_size
+        self.file = None
+        # When to switch to the next day's file.
+        self.rotate_at = 0.0
+        self.start()
+        atexit.register(self.close)
+        if hasattr(os, 'register_at_fork'):
+            # Don't let a forked process write out our buffer again, and give
+            # it its own flusher.
+            os.register_at_fork(
+                before=self.flush, after_in_child=self.start)
+
+    def start(self):
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.flusher = threading.Thread(target=self.run, daemon=True)
+        self.flusher.start()
+
+    def write(self, text: str):
+        now = time.time()
+        with self.lock:
+            if now >= self.rotate_at:
+                self.rotate(now)
+            self.file.write(text)
+
+    def rotate(self, now: float):
+        if self.file is not None:
+            self.file.close()
+        today = datetime.fromtimestamp(now)
+        path = self.directory / f'{today.strftime("%Y_%m_%d")}.txt'
+        self.file = open(
+            path, 'a', buffering=self.buffer_size, encoding='utf-8')
+        midnight = today.replace(hour=0, minute=0, second=0, microsecond=0)
+        self.rotate_at = (midnight + timedelta(days=1)).timestamp()
+
+    def run(self):
+        while not self.stopped.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.flush()
+
+    def close(self):
+        self.stopped.set()
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            # Reopen the file if anything else is logged.
+            self.rotate_at = 0.0
@@ -1,19 +1,61 @@
+import argparse
+import os
+import threading
 from datetime import datetime
-from pathlib import Path
 
+from main.logs.LogWriter import LogWriter
 from main.utils import project_root
 
+# Levels, as for the logging module. Anything below the current level is
+# dropped before it's formatted or written anywhere.
+DEBUG = 10
+INFO = 20
+WARNING = 30
+_level = DEBUG if os.environ.get('FLASHCARDS_DEBUG') else INFO
 
-def log(text: str, new_entry=False):
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def log(text: str, new_entry=False, level: int = INFO):
+    if level < _level:
+        return
     if new_entry:
         now = datetime.now().strftime('%d/%m/%Y, %H:%M:%S')
         log_text = f'\n{now}\n{text}'
     else:
         log_text = text
-    date = datetime.now().strftime('%Y_%m_%d')
-    log_path = f'{project_root()}/main/logs/{date}.txt'
-    Path(log_path).parent.mkdir(parents=True, exist_ok=True)
-    with open(log_path, 'a') as log_file:
-        log_file.write(f'\n{log_text}')
+    writer().write(f'\n{log_text}')
     # Also print to standard output.
     print(log_text)
+
+
+def debug(text: str):
+    log(text, level=DEBUG)
+
+
+def debug_enabled() -> bool:
+    # For callers to check before building expensive debug output (e.g.
+    # prettified HTML).
+    return _level <= DEBUG
+
+
+def set_level(level: int):
+    global _level
+    _level = level
+
+
+def add_log_args(parser: argparse.ArgumentParser):
+    verbose_help = 'Also log debug output (e.g. every Linguee result).'
+    parser.add_argument('--verbose', action='store_true', help=verbose_help)
+
+
+def writer() -> LogWriter:
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                directory = os.environ.get(
+                    'FLASHCARDS_LOG_DIR', f'{project_root()}/main/logs')
+                _writer = LogWriter(directory)
+    return _writer
@@ -1,43 +1,176 @@
 import json
-from typing import Iterable
+from typing import Iterable, Iterator, List
 
 import requests
 
-from main.authorization.Authorizer import Authorizer
+from main.HttpClient import HttpClient
 from main.logs.log import log
+from main.Metrics import Metrics
 from main.server.Phrase import Phrase
-from main.utils import RecursiveJsonEncoder
+from main.server.SyncCursor import SyncCursor
+from main.utils import CRUNCHY_NUT_URL, RecursiveJsonEncoder, \
+    iter_json_array
+
+metrics = Metrics.shared()
 
 
 class Server:
-    def __init__(self):
-        self.base_url = 'https://crunchy-nut-server.herokuapp.com'
+    def __init__(
+            self, http: HttpClient = None, authorizer=None,
+            cursors: SyncCursor = None,
+            base_url: str = CRUNCHY_NUT_URL,
+            page_size: int = 100, chunk_size: int = 64 * 1024,
+            bulk_size: int = 100):
+        self.base_url = base_url
         self.phrase_url = self.base_url + '/phrase/'
-        self.authorizer = Authorizer()
+        self.bulk_url = self.phrase_url + 'bulk'
+        if authorizer is None:
+            # Imported here so that the server can be used (e.g. in tests)
+            # without the real credentials.
+            from main.authorization.Authorizer import Authorizer
+            authorizer = Authorizer()
+        self.authorizer = authorizer
+        self.http = http if http is not None else HttpClient.shared()
+        self.http.retry_on_status(self.base_url)
+        self.cursors = cursors if cursors is not None else SyncCursor()
+        self.page_size = page_size
+        self.chunk_size = chunk_size
+        self.bulk_size = bulk_size
+        # Until the server tells us otherwise, assume it has the bulk route.
+        self.bulk_supported = True
 
-    def get_phrases(self, owner: str, include_flashcarded: bool = False):
+    @metrics.timed('server.get_phrases')
+    def get_phrases(
+            self, owner: str, include_flashcarded: bool = False,
+            incremental: bool = True) -> List[Phrase]:
+        # Unless incremental is False, only asks for phrases newer than the
+        # owner's cursor, a page at a time. Move the cursor on with
+        # advance_cursor once the phrases have been dealt with.
         log(f'Checking database for phrases for owner {owner}...')
         if include_flashcarded:
             log('Including already flashcarded phrases...')
+        cursor = self.cursors.get(owner) if incremental else None
+        if cursor is not None:
+            log(f'Only checking for phrases since {cursor[0]}...')
         authorization = self.authorizer.crunchy_nut_authorization(owner)
         headers = {'Authorization': authorization}
-        params = {'flashcarded': str(include_flashcarded).lower()}
-        response = requests.get(
-            self.phrase_url, params=params, headers=headers)
-        phrases = [Phrase.from_data(data) for data in response.json()]
+        phrases = []
+        while True:
+            params = {
+                'flashcarded': str(include_flashcarded).lower(),
+                'limit': self.page_size}
+            if cursor is not None:
+                params['since'], params['after'] = cursor
+            page = list(self.get_page(params, headers))
+            # In case the server doesn't filter by the cursor itself.
+            newer = [
+                phrase for phrase in page
+                if cursor is None or SyncCursor.key(phrase) > cursor]
+            phrases.extend(newer)
+            # A short page is the last one. So is a long one, since that
+            # means the server ignored the limit and sent everything.
+            if len(page) != self.page_size or not newer:
+                break
+            cursor = max(map(SyncCursor.key, newer))
         log(f'Got {len(phrases)} phrases...')
         return phrases
 
-    def post_phrases(self, phrases: Iterable[Phrase]):
+    def get_page(self, params, headers) -> Iterator[Phrase]:
+        with self.http.get(
+                self.phrase_url, params=params, headers=headers,
+                stream=True) as response:
+            response.raise_for_status()
+            chunks = response.iter_content(chunk_size=self.chunk_size)
+            for data in iter_json_array(chunks):
+                yield Phrase.from_data(data)
+
+    def advance_cursor(
+            self, owner: str, phrases: Iterable[Phrase],
+            done: Iterable[Phrase]):
+        self.cursors.advance(owner, phrases, done)
+
+    @metrics.timed('server.post_phrases')
+    def post_phrases(
+            self, phrases: Iterable[Phrase], retries: int = 2
+    ) -> List[Phrase]:
+        # Posts each owner's phrases in chunks of bulk_size to the bulk
+        # route, retrying only the phrases the server says failed. Returns
+        # the phrases we couldn't post back.
         log(f'Posting results back to database...')
+        by_owner = {}
         for phrase in phrases:
-            id = phrase.id if phrase.id is not None else ''
-            url = self.phrase_url + id
-            # TODO - check JSON encoder works on list of translations.
-            body = json.dumps(phrase, cls=RecursiveJsonEncoder)
-            authorization = \
-                self.authorizer.crunchy_nut_authorization(phrase.owner)
+            by_owner.setdefault(phrase.owner, []).append(phrase)
+        failed = []
+        for owner, owned in by_owner.items():
+            authorization = self.authorizer.crunchy_nut_authorization(owner)
             headers = {
                 'Content-Type': 'application/json',
                 'Authorization': authorization}
-            requests.post(url, data=body, headers=headers)
+            for start in range(0, len(owned), self.bulk_size):
+                chunk = owned[start:start + self.bulk_size]
+                failed.extend(self.post_chunk(chunk, headers, retries))
+        if failed:
+            log(f"Couldn't post {len(failed)} phrases back to database...")
+        return failed
+
+    def post_chunk(
+            self, phrases: List[Phrase], headers, retries: int
+    ) -> List[Phrase]:
+        # Whether the server last answered, but not with a result per phrase.
+        unreadable = False
+        for attempt in range(retries + 1):
+            if not phrases:
+                break
+            unreadable = False
+            if not self.bulk_supported:
+                return self.post_each(phrases, headers)
+            # TODO - check JSON encoder works on list of translations.
+            body = json.dumps(phrases, cls=RecursiveJsonEncoder)
+            try:
+                response = self.http.post(
+                    self.bulk_url, data=body, headers=headers)
+            except requests.RequestException as exception:
+                log(f'Posting {len(phrases)} phrases failed: {exception}')
+                continue
+            if response.status_code in (404, 405):
+                log('Server has no bulk route - posting phrases one by one...')
+                self.bulk_supported = False
+                return self.post_each(phrases, headers)
+            if not response.ok:
+                log(
+                    f'Posting {len(phrases)} phrases failed: '
+                    f'{response.status_code}')
+                continue
+            # The server gives back a result for each phrase, in order.
+            try:
+                ok = [result.get('ok', False) for result in response.json()]
+            except (ValueError, TypeError, AttributeError) as exception:
+                log(
+                    f'Posting {len(phrases)} phrases gave back something '
+                    f'other than their results: {exception}')
+                unreadable = True
+                continue
+            if len(ok) != len(phrases):
+                log(f'Expected {len(phrases)} results, got {len(ok)}...')
+                unreadable = True
+                continue
+            phrases = [
+                phrase for phrase, posted in zip(phrases, ok) if not posted]
+        if phrases and unreadable:
+            log('Posting the phrases one by one instead...')
+            return self.post_each(phrases, headers)
+        return phrases
+
+    def post_each(self, phrases: List[Phrase], headers) -> List[Phrase]:
+        failed = []
+        for phrase in phrases:
+            id = phrase.id if phrase.id is not None else ''
+            url = self.phrase_url + id
+            body = json.dumps(phrase, cls=RecursiveJsonEncoder)
+            try:
+                response = self.http.post(url, data=body, headers=headers)
+                response.raise_for_status()
+            except requests.RequestException as exception:
+                log(f'Posting {phrase.german} failed: {exception}')
+                failed.append(phrase)
+        return failed
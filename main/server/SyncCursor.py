@@ -0,0 +1,66 @@
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Iterable, Optional, Tuple
+
+from main.server.Phrase import Phrase
+from main.utils import cache_dir
+
+
+class SyncCursor:
+    # Remembers, per owner, the newest phrase we've finished with (by its
+    # database_date, then id), so that each poll of the server only asks for
+    # phrases added since then, rather than everything the owner has ever
+    # shared.
+    def __init__(self, path: str = None):
+        if path is None:
+            path = f'{cache_dir()}/cursors.db'
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS cursors ('
+                'owner TEXT PRIMARY KEY, database_date TEXT, id TEXT)')
+
+    @staticmethod
+    def key(phrase: Phrase) -> Tuple[str, str]:
+        # The order the server returns phrases in.
+        return phrase.database_date or '', phrase.id or ''
+
+    def get(self, owner: str) -> Optional[Tuple[str, str]]:
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT database_date, id FROM cursors WHERE owner = ?',
+                (owner,)).fetchone()
+        return tuple(row) if row is not None else None
+
+    def set(self, owner: str, key: Tuple[str, str]):
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO cursors (owner, database_date, id) '
+                'VALUES (?, ?, ?)', (owner, *key))
+
+    def reset(self, owner: str):
+        with self.lock, self.connection:
+            self.connection.execute(
+                'DELETE FROM cursors WHERE owner = ?', (owner,))
+
+    def advance(
+            self, owner: str, phrases: Iterable[Phrase],
+            done: Iterable[Phrase]):
+        # Move the cursor past every phrase up to the first one we didn't
+        # manage to flashcard, so that next time we ask for that one (and
+        # everything after it) again.
+        done_ids = {id(phrase) for phrase in done}
+        newest = None
+        for phrase in sorted(phrases, key=self.key):
+            if id(phrase) not in done_ids:
+                break
+            newest = self.key(phrase)
+        current = self.get(owner)
+        if newest is not None and (current is None or newest > current):
+            self.set(owner, newest)
+
+    def close(self):
+        self.connection.close()
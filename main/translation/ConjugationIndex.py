@@ -0,0 +1,77 @@
+import sqlite3
+import threading
+import unicodedata
+import urllib.parse
+from pathlib import Path
+from typing import Optional
+
+from bs4 import BeautifulSoup
+
+from main.logs.log import log
+from main.translation.PageCache import PageCache
+from main.utils import VERBFORMEN_URL, cache_dir
+
+VERBFORMEN_HOST = urllib.parse.urlsplit(VERBFORMEN_URL).netloc
+
+
+class ConjugationIndex:
+    # The principal parts ('Stammformen') of every verb we've conjugated, so
+    # that we only have to ask verbformen.de about each verb once.
+    def __init__(self, path: str = None):
+        if path is None:
+            path = f'{cache_dir()}/conjugations.db'
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS conjugations ('
+                'verb TEXT PRIMARY KEY, conjugation TEXT)')
+
+    def get(self, verb: str) -> Optional[str]:
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT conjugation FROM conjugations WHERE verb = ?',
+                (self.normalise(verb),)).fetchone()
+        return row[0] if row is not None else None
+
+    def put(self, verb: str, conjugation: str):
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO conjugations VALUES (?, ?)',
+                (self.normalise(verb), conjugation))
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute(
+                'SELECT COUNT(*) FROM conjugations').fetchone()[0]
+
+    def import_pages(self, page_cache: PageCache):
+        # Fill the index from any verbformen pages we already have cached.
+        imported = 0
+        for url in page_cache.urls():
+            parts = urllib.parse.urlsplit(url)
+            if parts.netloc != VERBFORMEN_HOST:
+                continue
+            verb = urllib.parse.parse_qs(parts.query).get('w', [None])[0]
+            content = page_cache.content(url)
+            if verb is None or content is None:
+                continue
+            conjugation = find_conjugation(content)
+            if conjugation is not None:
+                self.put(verb, conjugation)
+                imported += 1
+        log(f'Imported {imported} conjugation(s) from cached pages...')
+
+    @staticmethod
+    def normalise(verb: str):
+        return unicodedata.normalize('NFC', verb).strip()
+
+
+def find_conjugation(content: bytes) -> Optional[str]:
+    # Find the principal parts on a verbformen.de page.
+    soup = BeautifulSoup(content, "html.parser")
+    conjugation = soup.find(id='stammformen')
+    if conjugation is not None:
+        return conjugation.text.strip()
+    return None
@@ -0,0 +1,95 @@
+from typing import List
+
+import lxml.etree
+import lxml.html
+from bs4 import BeautifulSoup
+from bs4.dammit import UnicodeDammit
+
+from main.logs.log import debug, debug_enabled, log
+from main.translation.Translation import Translation
+
+
+class LingueeParser:
+    # Finds the translations in a Linguee results page. The pages are big,
+    # but everything we need is in the #dictionary div. With the 'lxml'
+    # backend, lxml (which is written in C) finds that div, and only the div
+    # is parsed into a BeautifulSoup tree for Translation to pick apart. The
+    # 'html.parser' backend parses the whole page with BeautifulSoup's
+    # pure-Python parser instead, which is much slower. Both give the same
+    # translations.
+    BACKENDS = ['lxml', 'html.parser']
+
+    def __init__(self, backend: str = 'lxml', comprehensive: bool = False):
+        if backend not in self.BACKENDS:
+            raise ValueError(f'Unknown Linguee parser backend {backend}')
+        self.backend = backend
+        # If comprehensive is True, we return all translations, at the risk
+        # of adding more unnecessary ones.
+        self.comprehensive = comprehensive
+
+    def find_dictionary(self, content: bytes):
+        if self.backend == 'html.parser':
+            soup = BeautifulSoup(content, "html.parser")
+            return soup.find(id='dictionary')
+        # Work out the encoding the same way BeautifulSoup would.
+        markup = UnicodeDammit(content, is_html=True).unicode_markup
+        if not markup:
+            return None
+        try:
+            document = lxml.html.fromstring(markup)
+        except lxml.etree.ParserError:
+            # Nothing but whitespace or comments - html.parser finds nothing
+            # in that either.
+            return None
+        dictionary = document.find('.//*[@id="dictionary"]')
+        if dictionary is None:
+            return None
+        subtree = lxml.html.tostring(
+            dictionary, encoding='unicode', with_tail=False)
+        return BeautifulSoup(subtree, 'lxml').find(id='dictionary')
+
+    def translate(self, german: str, content: bytes) -> List[Translation]:
+        search_results = self.find_dictionary(content)
+        if search_results is not None:
+            search_results = search_results.find(class_='isForeignTerm')
+            if search_results is not None:
+                classes = ['lemma featured']
+                if self.comprehensive:
+                    classes.append('lemma')
+                exact_results = search_results.find(class_='exact')
+                if exact_results is not None:
+                    translations = \
+                        self.exact_translate(exact_results, classes)
+                else:
+                    translations = \
+                        self.inexact_translate(search_results, classes)
+                for translation in translations:
+                    translation.source = f'Linguee - \'{german}\''
+                return translations
+        log(f'Linguee has no translation for \'{german}\'')
+        return []
+
+    def inexact_translate(self, search_results, classes):
+        # What to do here?
+        translations = []
+        inexact_results = search_results.find(class_='inexact')
+        if inexact_results is not None:
+            log('Only found inexact result(s)')
+        else:
+            log('No results found!')
+            if debug_enabled():
+                debug('See HTML below:')
+                debug(search_results.prettify())
+        return translations
+
+    def exact_translate(self, exact_results, classes):
+        log('Found exact match(es)...')
+        translations = []
+        for class_ in classes:
+            for result in exact_results.select(f'div[class="{class_}"]'):
+                translations.append(
+                    Translation.from_linguee_result_tag(result))
+        log(f'Got {len(translations)} exact linguee result(s)...')
+        if debug_enabled():
+            [debug(str(translation)) for translation in translations]
+        return translations
@@ -0,0 +1,162 @@
+import hashlib
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+
+import requests
+
+from main.HttpClient import HttpClient
+from main.logs.log import log
+from main.Metrics import Metrics
+from main.utils import cache_dir
+
+
+class Page:
+    # The parts of a requests.Response that we use, for pages from the cache.
+    def __init__(self, url: str, status_code: int, content: bytes):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+
+
+class PageCache:
+    # Stores the raw HTML of the Linguee and verbformen pages we fetch, so
+    # that changes to the parsing logic can be replayed against them offline.
+    # Pages are stored compressed and addressed by the hash of their content,
+    # so identical pages are only stored once. A page younger than `max_age`
+    # seconds is served straight from the cache; an older one is revalidated
+    # with its ETag/Last-Modified headers. Once there are more than
+    # `max_pages` pages or `max_bytes` of compressed content, the least
+    # recently used pages are evicted.
+    def __init__(
+            self, path: str = None, max_age: float = 24 * 60 * 60,
+            max_pages: int = 20_000, max_bytes: int = 500 * 1024 * 1024,
+            offline: bool = False):
+        if path is None:
+            path = f'{cache_dir()}/pages.db'
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_age = max_age
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+        # If offline is True, we only ever serve pages from the cache.
+        self.offline = offline
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS pages ('
+                'url TEXT PRIMARY KEY, digest TEXT, etag TEXT, '
+                'last_modified TEXT, fetched REAL, accessed REAL)')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS blobs ('
+                'digest TEXT PRIMARY KEY, size INTEGER, content BLOB)')
+            self.connection.execute(
+                'CREATE INDEX IF NOT EXISTS pages_accessed '
+                'ON pages (accessed)')
+
+    def get(self, url: str, fetch=None):
+        # `fetch` is used for any request we do have to send, and must take
+        # the same arguments as requests.get.
+        if fetch is None:
+            fetch = HttpClient.shared().get
+        cached = self.cached(url)
+        now = time.time()
+        if cached is not None:
+            digest, etag, last_modified, fetched = cached
+            if self.offline or now - fetched <= self.max_age:
+                Metrics.shared().count('page_cache_hits')
+                return self.hit(url, digest, now)
+        elif self.offline:
+            return Page(url, 404, b'')
+        Metrics.shared().count('page_cache_misses')
+
+        headers = {}
+        if cached is not None:
+            if etag is not None:
+                headers['If-None-Match'] = etag
+            if last_modified is not None:
+                headers['If-Modified-Since'] = last_modified
+        response = fetch(url, headers=headers)
+        if response.status_code == 304 and cached is not None:
+            log(f'Cached page for {url} is still valid...')
+            Metrics.shared().count('page_cache_revalidations')
+            with self.lock, self.connection:
+                self.connection.execute(
+                    'UPDATE pages SET fetched = ? WHERE url = ?', (now, url))
+            return self.hit(url, digest, now)
+        if response.status_code == 200:
+            self.put(url, response, now)
+        return response
+
+    def cached(self, url: str):
+        with self.lock:
+            return self.connection.execute(
+                'SELECT digest, etag, last_modified, fetched FROM pages '
+                'WHERE url = ?', (url,)).fetchone()
+
+    def hit(self, url: str, digest: str, now: float):
+        with self.lock, self.connection:
+            self.connection.execute(
+                'UPDATE pages SET accessed = ? WHERE url = ?', (now, url))
+            content, = self.connection.execute(
+                'SELECT content FROM blobs WHERE digest = ?',
+                (digest,)).fetchone()
+        return Page(url, 200, zlib.decompress(content))
+
+    def put(self, url: str, response: requests.Response, now: float):
+        digest = hashlib.sha256(response.content).hexdigest()
+        content = zlib.compress(response.content)
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT OR IGNORE INTO blobs VALUES (?, ?, ?)',
+                (digest, len(content), content))
+            self.connection.execute(
+                'INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)',
+                (url, digest, response.headers.get('ETag'),
+                 response.headers.get('Last-Modified'), now, now))
+            self.evict()
+
+    def evict(self):
+        # Must be called with the lock held, inside a transaction.
+        self.connection.execute(
+            'DELETE FROM pages WHERE url IN ('
+            'SELECT url FROM pages ORDER BY accessed DESC '
+            'LIMIT -1 OFFSET ?)', (self.max_pages,))
+        self.delete_unused_blobs()
+        total_bytes = self.total_bytes()
+        while total_bytes > self.max_bytes:
+            oldest = self.connection.execute(
+                'SELECT url FROM pages ORDER BY accessed LIMIT 1').fetchone()
+            if oldest is None:
+                break
+            self.connection.execute(
+                'DELETE FROM pages WHERE url = ?', oldest)
+            self.delete_unused_blobs()
+            total_bytes = self.total_bytes()
+
+    def total_bytes(self):
+        total_bytes, = self.connection.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM blobs').fetchone()
+        return total_bytes
+
+    def delete_unused_blobs(self):
+        self.connection.execute(
+            'DELETE FROM blobs WHERE digest NOT IN '
+            '(SELECT digest FROM pages)')
+
+    def content(self, url: str):
+        # The cached content of `url`, without going to the network at all.
+        cached = self.cached(url)
+        if cached is None:
+            return None
+        digest, _, _, _ = cached
+        return self.hit(url, digest, time.time()).content
+
+    def urls(self):
+        # Every page in the cache, e.g. to replay the parsers against them.
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT url FROM pages ORDER BY url').fetchall()
+        return [url for url, in rows]
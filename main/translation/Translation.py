@@ -1,7 +1,11 @@
 import unicodedata
+from typing import List, Tuple
+
 import bs4.element
 
-from main.logs.log import log
+from main.logs.log import debug, debug_enabled
+from main.translation.parse_dictionaries.dictionary_store import \
+    find_plurals
 
 
 class Translation:
@@ -32,19 +36,14 @@ class Translation:
             self.article = article
 
     def find_plural(self, soup: bs4.BeautifulSoup):
-        # Find all nouns with same gender as this phrase.
-        matches = [
-            x for x in soup.find_all(class_='gramb x_xd0')
-            if x.find(class_='ps').text.startswith(self.category[6:])]
-        plural_starts = [
-            match.find('span', text='Pl. ')
-            for match in matches
-        ]
+        self.set_plural(find_plurals(soup))
+
+    def set_plural(self, plurals: List[Tuple[str, str]]):
+        # `plurals` are (part of speech, plural) pairs, as given by
+        # find_plurals. Use all nouns with same gender as this phrase.
         plurals = [
-            plural_start.findNext().text.strip()
-            for plural_start in plural_starts
-            if plural_start is not None
-        ]
+            plural for part_of_speech, plural in plurals
+            if part_of_speech.startswith(self.category[6:])]
         self.plural = '/'.join(plurals) if plurals else '?'
 
     @classmethod
@@ -62,7 +61,7 @@ class Translation:
 
     @classmethod
     def from_linguee_result_tag(cls, result):
-        log('Trying to extract German-English phrase...')
+        debug('Trying to extract German-English phrase...')
         german_tag = result.find(class_='line lemma_desc')
         translation = cls.extract_german(german_tag)
         top_three_translations = result \
@@ -76,12 +75,12 @@ class Translation:
         examples = top_three_translations[0].find(class_='example_lines')
         if examples is not None:
             translation.example = examples.find(class_='tag_s').text
-        log(f'Extracted German-English phrase! {translation}')
+        debug(f'Extracted German-English phrase! {translation}')
         return translation
 
     @classmethod
     def extract_german(cls, german_tag: bs4.element.Tag):
-        log('Trying to extract German...')
+        debug('Trying to extract German...')
         sub_tags = german_tag.find_all(class_='dictLink')
         german = ' '.join([
             cls.format_contents(sub_tag) for sub_tag in sub_tags])
@@ -93,7 +92,7 @@ class Translation:
             category = cls.format_contents(category)
         # Okay for category and/or context to be None.
         translation = cls(german, category, context)
-        log(f'Extracted German! {translation}')
+        debug(f'Extracted German! {translation}')
         return translation
 
     @classmethod
@@ -110,8 +109,9 @@ class Translation:
                 elif 'placeholder' in class_:
                     result.append(cls.format_contents(item))
                 elif class_ is not None:
-                    log(f'New tag class found!')
-                    log(item.prettify())
+                    if debug_enabled():
+                        debug(f'New tag class found!')
+                        debug(item.prettify())
                     result.append(cls.format_contents(item))
         return ''.join(unicodedata.normalize("NFKD", x) for x in result)
 
@@ -0,0 +1,83 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+from typing import List, Optional
+
+from main.translation.Translation import Translation
+from main.utils import cache_dir, RecursiveJsonEncoder
+
+
+class TranslationCache:
+    # Stores the final, cleaned translations of each phrase on disk, so that
+    # we don't have to ask Linguee, verbformen or DeepL about the same phrase
+    # twice. Translations are stored separately per source (e.g. Linguee and
+    # DeepL), expire after `ttl` seconds, and once there are more than
+    # `max_entries` the least recently used ones are evicted.
+    def __init__(
+            self, path: str = None, ttl: float = 30 * 24 * 60 * 60,
+            max_entries: int = 100_000, refresh: bool = False):
+        if path is None:
+            path = f'{cache_dir()}/translations.db'
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # If refresh is True, we never read from the cache, but still write
+        # everything we translate to it.
+        self.refresh = refresh
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS translations ('
+                'phrase TEXT, source TEXT, translations TEXT, '
+                'created REAL, accessed REAL, '
+                'PRIMARY KEY (phrase, source))')
+            self.connection.execute(
+                'CREATE INDEX IF NOT EXISTS translations_accessed '
+                'ON translations (accessed)')
+
+    def get(self, german: str, source: str) -> Optional[List[Translation]]:
+        if self.refresh:
+            return None
+        phrase = self.normalise(german)
+        now = time.time()
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                'SELECT translations, created FROM translations '
+                'WHERE phrase = ? AND source = ?', (phrase, source)).fetchone()
+            if row is None:
+                return None
+            translations_json, created = row
+            if now - created > self.ttl:
+                self.connection.execute(
+                    'DELETE FROM translations WHERE phrase = ? AND source = ?',
+                    (phrase, source))
+                return None
+            self.connection.execute(
+                'UPDATE translations SET accessed = ? '
+                'WHERE phrase = ? AND source = ?', (now, phrase, source))
+        return [
+            Translation.from_data(data)
+            for data in json.loads(translations_json)]
+
+    def put(self, german: str, source: str, translations: List[Translation]):
+        phrase = self.normalise(german)
+        translations_json = json.dumps(translations, cls=RecursiveJsonEncoder)
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?)',
+                (phrase, source, translations_json, now, now))
+            self.connection.execute(
+                'DELETE FROM translations WHERE rowid IN ('
+                'SELECT rowid FROM translations ORDER BY accessed DESC '
+                'LIMIT -1 OFFSET ?)', (self.max_entries,))
+
+    @staticmethod
+    def normalise(german: str):
+        german = unicodedata.normalize('NFC', german)
+        return re.sub(r'\s+', ' ', german).strip()
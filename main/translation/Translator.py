@@ -1,17 +1,27 @@
+import os
 import unicodedata
 import urllib.parse
 import deepl
-import requests
 
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
 from bs4 import BeautifulSoup
 from requests import Response
 
-from main.authorization.Authorizer import Authorizer
-from main.logs.log import log
-from main.translation.parse_dictionaries.parse_dict import unpickle_dict
+from main.HttpClient import HttpClient
+from main.logs.log import debug, debug_enabled, log
+from main.Metrics import Metrics
+from main.RateLimiter import RateLimiter
+from main.translation.parse_dictionaries.dictionary_store import \
+    DictionaryStore, find_plurals, unpickle_dict
+from main.translation.ConjugationIndex import ConjugationIndex, \
+    find_conjugation
+from main.translation.LingueeParser import LingueeParser
+from main.translation.PageCache import PageCache
 from main.translation.Translation import Translation
-from main.utils import project_root
+from main.translation.TranslationCache import TranslationCache
+from main.utils import DEEPL_SERVER_URL, LINGUEE_URL, VERBFORMEN_URL, \
+    project_root
 
 
 # Possible word types: adjective, adverb, noun, verb, interjection. More?
@@ -24,40 +34,104 @@ from main.utils import project_root
 #  If it has pre-downloaded results that it exposes then maybe use
 #  this to stop pinging Linguee too much.
 
+# DeepL accepts at most 50 texts per request, and requests must stay well
+# under its 128 KiB size limit.
+DEEPL_MAX_TEXTS = 50
+DEEPL_MAX_CHARACTERS = 30_000
+
+metrics = Metrics.shared()
+
 
 class Translator:
-    def __init__(self, user_name: str, comprehensive: bool = False):
+    def __init__(
+            self, user_name: str, comprehensive: bool = False,
+            apple_dict=None, cache: TranslationCache = None,
+            page_cache: PageCache = None, http: HttpClient = None,
+            html_parser: str = 'lxml',
+            conjugations: ConjugationIndex = None, authorizer=None):
         # If comprehensive is True, we return all translations, at the risk
         # of adding more unnecessary ones.
         self.comprehensive = comprehensive
-        self.authorizer = Authorizer()
+        self.linguee_parser = LingueeParser(html_parser, comprehensive)
+        if authorizer is None:
+            # Imported here so that the translator can be used (e.g. in
+            # benchmarks) without the real credentials.
+            from main.authorization.Authorizer import Authorizer
+            authorizer = Authorizer()
+        self.authorizer = authorizer
         deepl_authorization = self.authorizer.deepl_authorization(user_name)
-        self.deepl = deepl.Translator(deepl_authorization)
+        self.deepl = deepl.Translator(
+            deepl_authorization, server_url=DEEPL_SERVER_URL)
+        # The host the deepl package sends our requests to, for the rate
+        # limiter. Unless it's overridden, that depends on the account.
+        self.deepl_url = DEEPL_SERVER_URL
+        if self.deepl_url is None:
+            free = deepl.util.auth_key_is_free_account(deepl_authorization)
+            self.deepl_url = 'https://api-free.deepl.com' if free \
+                else 'https://api.deepl.com'
+        # The Apple dictionary can be shared between Translators.
+        self.apple_dict = apple_dict if apple_dict is not None \
+            else self.load_apple_dict()
+        # If there's no cache, every translation goes to the network.
+        self.cache = cache
+        self.page_cache = page_cache
+        # Verbs we've conjugated before, so we needn't ask verbformen again.
+        self.conjugations = conjugations
+        self.http = http if http is not None else HttpClient.shared()
+        # No limit unless we're translating a batch - see translate_many.
+        self.rate_limiter = RateLimiter()
+
+    @staticmethod
+    def load_apple_dict():
         apple_dict_path = \
             f'{project_root()}/' \
             f'main/' \
             f'translation/' \
             f'parse_dictionaries/' \
-            f'apple_german_english.pickle'
-        self.apple_dict = unpickle_dict(apple_dict_path)
+            f'apple_german_english'
+        # Prefer the on-disk store, which only reads the entries we look up.
+        if os.path.exists(f'{apple_dict_path}.sqlite'):
+            return DictionaryStore(f'{apple_dict_path}.sqlite')
+        else:
+            log('No Apple dictionary store found - unpickling instead...')
+            return unpickle_dict(f'{apple_dict_path}.pickle')
 
-    def translate(self, german: str, new_log_entry=True):
+    @metrics.timed('translate')
+    def translate(
+            self, german: str, new_log_entry=True, fall_back_to_deepl=True):
+        # If fall_back_to_deepl is False, an empty list means Linguee had no
+        # translation and the phrase should be sent to DeepL by the caller.
         try:
             log(f'Translating {german}...', new_log_entry)
             # At first, try to translate with Linguee.
-            translations = self.search_linguee(german)
-            # If we get a None back, Linguee server rejected us - don't
-            # fall through to just using DeepL!
-            if translations is not None:
+            linguee_source = \
+                'Linguee (comprehensive)' if self.comprehensive else 'Linguee'
+            translations = self.cached(german, linguee_source)
+            if translations is None:
+                translations = self.search_linguee(german)
+                # If we get a None back, Linguee server rejected us - don't
+                # fall through to just using DeepL!
+                if translations is None:
+                    return None
                 if len(translations) > 0:
                     # Remove verbs-as-nouns, adverbs of adjectives, etc.
-                    return self.clean_linguee_translations(translations)
+                    translations = \
+                        self.clean_linguee_translations(translations)
+                # Cache even if there are no results, so that next time we
+                # go straight to DeepL. But if a verb couldn't be conjugated
+                # (e.g. verbformen was down), try again next time.
+                if all(
+                        translation.conjugation is not None
+                        for translation in translations
+                        if translation.category == 'verb'):
+                    self.cache_put(german, linguee_source, translations)
                 else:
-                    # Search DeepL for this phrase instead
-                    translation = self.deepl_translate(german)
-                    return [translation]
-            else:
-                return None
+                    log(f'Not caching the incomplete translations of '
+                        f'\'{german}\'...')
+            if len(translations) > 0 or not fall_back_to_deepl:
+                return translations
+            # Search DeepL for this phrase instead
+            return self.deepl_translate_many([german])[0]
         except Exception as e:
             text = \
                 f'The following error occurred ' \
@@ -65,6 +139,60 @@ class Translator:
             log(text)
             return None
 
+    def get_page(self, url: str):
+        if self.page_cache is not None:
+            return self.page_cache.get(url, fetch=self.fetch)
+        return self.fetch(url)
+
+    def fetch(self, url: str, **kwargs):
+        self.rate_limiter.wait(url)
+        return self.http.get(url, **kwargs)
+
+    def cached(self, german: str, source: str):
+        if self.cache is None:
+            return None
+        translations = self.cache.get(german, source)
+        if translations is not None:
+            log(f'Found {source} translations of \'{german}\' in cache...')
+            metrics.count('translation_cache_hits', source=source)
+        else:
+            metrics.count('translation_cache_misses', source=source)
+        return translations
+
+    def cache_put(self, german: str, source: str, translations):
+        if self.cache is not None:
+            self.cache.put(german, source, translations)
+
+    @metrics.timed('translate_many')
+    def translate_many(
+            self, phrases: List[str], max_concurrency: int = 4,
+            per_host_rate: Optional[float] = 1.0):
+        # Translate several phrases at once, so that we're not sat waiting on
+        # Linguee, verbformen or DeepL for one phrase at a time. Each host
+        # still gets at most `per_host_rate` requests a second, since Linguee
+        # starts refusing us (with a 5xx) if we send too many. Phrases that
+        # Linguee can't translate are sent to DeepL together at the end.
+        # Results are in the same order as `phrases`, with None wherever
+        # translate would have returned None.
+        previous_rate_limiter = self.rate_limiter
+        self.rate_limiter = RateLimiter(per_host_rate)
+        try:
+            with ThreadPoolExecutor(max_concurrency) as executor:
+                results = list(executor.map(
+                    lambda german: self.translate(
+                        german, new_log_entry=False, fall_back_to_deepl=False),
+                    phrases))
+            for_deepl = [
+                i for i, translations in enumerate(results)
+                if translations is not None and len(translations) == 0]
+            deepl_results = self.deepl_translate_many(
+                [phrases[i] for i in for_deepl])
+            for i, translations in zip(for_deepl, deepl_results):
+                results[i] = translations
+            return results
+        finally:
+            self.rate_limiter = previous_rate_limiter
+
     def clean_linguee_translations(self, translations):
         translations = self.remove_derivatives(translations)
         translations = self.add_noun_plurals(translations)
@@ -75,7 +203,8 @@ class Translator:
         return translations
 
     def search_linguee(self, german: str):
-        response = requests.get(self.linguee_url(german))
+        with metrics.span('linguee.fetch'):
+            response = self.get_page(self.linguee_url(german))
         if response.status_code >= 500:
             error = \
                 'Linguee server error - probably from sending too many ' \
@@ -87,49 +216,10 @@ class Translator:
         else:
             return self.linguee_translate(german, response)
 
+    @metrics.timed('linguee.parse')
     def linguee_translate(self, german: str, response: Response):
         log('Trying to translate with Linguee...')
-        soup = BeautifulSoup(response.content, "html.parser")
-        search_results = soup.find(id='dictionary')
-        if search_results is not None:
-            search_results = search_results.find(class_='isForeignTerm')
-            if search_results is not None:
-                classes = ['lemma featured']
-                if self.comprehensive:
-                    classes.append('lemma')
-                exact_results = search_results.find(class_='exact')
-                if exact_results is not None:
-                    translations = \
-                        self.exact_linguee_translate(exact_results, classes)
-                else:
-                    translations = \
-                        self.inexact_linguee_translate(search_results, classes)
-                for translation in translations:
-                    translation.source = f'Linguee - \'{german}\''
-                return translations
-        log(f'Linguee has no translation for \'{german}\'')
-        return []
-
-    def inexact_linguee_translate(self, search_results, classes):
-        # What to do here?
-        translations = []
-        inexact_results = search_results.find(class_='inexact')
-        if inexact_results is not None:
-            log('Only found inexact result(s)')
-        else:
-            log('No results found! See HTML below:')
-            log(search_results.prettify())
-        return translations
-
-    def exact_linguee_translate(self, exact_results, classes):
-        log('Found exact match(es)...')
-        translations = []
-        for class_ in classes:
-            for result in exact_results.select(f'div[class="{class_}"]'):
-                translations.append(Translation.from_linguee_result_tag(result))
-        log('Got exact linguee results:')
-        [log(str(translation)) for translation in translations]
-        return translations
+        return self.linguee_parser.translate(german, response.content)
 
     def remove_derivatives(self, hits: List[Translation]):
         found_derivatives = False
@@ -152,10 +242,12 @@ class Translator:
 
         if found_derivatives:
             log('Removed some duplicates - now we have:')
-            [log(str(x)) for x in filtered]
+            if debug_enabled():
+                [debug(str(x)) for x in filtered]
 
         return filtered
 
+    @metrics.timed('add_noun_plurals')
     def add_noun_plurals(self, hits: List[Translation]):
         # Remove linguee's plurals - I don't trust them
         hits = [hit for hit in hits if hit.category != 'noun, plural']
@@ -166,9 +258,7 @@ class Translator:
         for noun in nouns:
             log(f'Pluralising {noun.german} ({noun.category})...')
             if noun.german in self.apple_dict:
-                page = self.apple_dict[noun.german]
-                soup = BeautifulSoup(page, "html.parser")
-                noun.find_plural(soup)
+                noun.set_plural(self.find_plurals(noun.german))
             else:
                 # Not hundy cent sure what to do here?
                 log(f"'{noun.german}' not in Apple dictionary.")
@@ -177,31 +267,88 @@ class Translator:
         log('Nouns pluralised!')
         return hits
 
+    def find_plurals(self, german: str):
+        # Dictionary stores have the plurals of every entry worked out in
+        # advance; otherwise we have to parse the entry to find them.
+        if isinstance(self.apple_dict, DictionaryStore):
+            plurals = self.apple_dict.plurals(german)
+            if plurals is not None:
+                return plurals
+        soup = BeautifulSoup(self.apple_dict[german], "html.parser")
+        return find_plurals(soup)
+
+    @metrics.timed('conjugate_verbs')
     def conjugate_verbs(self, verbs: List[Translation]):
         for verb in verbs:
             log(f'Conjugating verb \'{verb.german}\'...')
+            if self.conjugations is not None:
+                verb.conjugation = self.conjugations.get(verb.german)
+                if verb.conjugation is not None:
+                    continue
             url = self.conjugator_url(verb.german)
-            page = requests.get(url)
-            soup = BeautifulSoup(page.content, "html.parser")
-            conjugation = soup.find(id='stammformen')
+            page = self.get_page(url)
+            conjugation = find_conjugation(page.content)
             if conjugation is not None:
-                verb.conjugation = conjugation.text.strip()
+                verb.conjugation = conjugation
+                if self.conjugations is not None:
+                    self.conjugations.put(verb.german, conjugation)
             else:
                 log(f"Couldn't conjugate verb '{verb.german}'")
         log('Verbs conjugated!')
 
-    def deepl_translate(self, german: str):
-        log('Translating with DeepL...')
-        english = self.deepl.translate_text(
-            german, source_lang='DE', target_lang='EN-GB').text
-        translation = Translation(
-            german, english=english, source=f'DeepL = \'{german}\'')
-        return translation
+    @metrics.timed('deepl')
+    def deepl_translate_many(
+            self, germans: List[str], max_texts: int = DEEPL_MAX_TEXTS,
+            max_characters: int = DEEPL_MAX_CHARACTERS):
+        # Translate with DeepL, sending as many phrases per request as the
+        # caps allow. Returns a list of translations per phrase, in the same
+        # order as `germans`, with None for any phrase whose request failed.
+        results = {}
+        to_send = []
+        for german in germans:
+            if german not in results:
+                results[german] = self.cached(german, 'DeepL')
+                if results[german] is None:
+                    to_send.append(german)
+        for batch in self.deepl_batches(to_send, max_texts, max_characters):
+            log(f'Translating {len(batch)} phrase(s) with DeepL...')
+            try:
+                self.rate_limiter.wait(self.deepl_url)
+                englishes = self.deepl.translate_text(
+                    batch, source_lang='DE', target_lang='EN-GB')
+            except Exception as e:
+                log(f'The following error occurred translating {batch} '
+                    f'with DeepL: {str(e)}')
+                continue
+            for german, english in zip(batch, englishes):
+                translation = Translation(
+                    german, english=english.text,
+                    source=f'DeepL = \'{german}\'')
+                results[german] = [translation]
+                self.cache_put(german, 'DeepL', results[german])
+        return [results[german] for german in germans]
+
+    @staticmethod
+    def deepl_batches(
+            germans: List[str], max_texts: int, max_characters: int):
+        batch = []
+        characters = 0
+        for german in germans:
+            too_many_texts = len(batch) == max_texts
+            too_many_characters = characters + len(german) > max_characters
+            if batch and (too_many_texts or too_many_characters):
+                yield batch
+                batch = []
+                characters = 0
+            batch.append(german)
+            characters += len(german)
+        if batch:
+            yield batch
 
     def linguee_url(self, phrase: str):
         phrase = urllib.parse.quote(phrase)
         return \
-            f'https://www.linguee.com' \
+            f'{LINGUEE_URL}' \
             f'/english-german' \
             f'/search' \
             f'?source=auto' \
@@ -209,4 +356,4 @@ class Translator:
 
     def conjugator_url(self, verb: str):
         verb = unicodedata.normalize('NFC', verb)
-        return f'https://www.verbformen.de/?w={verb}'
+        return f'{VERBFORMEN_URL}/?w={verb}'
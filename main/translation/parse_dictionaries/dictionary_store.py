@@ -0,0 +1,88 @@
+"""
+Look up entries in a parsed Apple dictionary, as Translator does.
+
+parse_dict builds dictionaries (and DictionaryStores); this module only reads
+them, so it doesn't pull in any of the parsing.
+"""
+import pickle
+import sqlite3
+import zlib
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from bs4 import BeautifulSoup
+
+
+class DictionaryStore:
+    """A parsed dictionary stored on disk in SQLite.
+
+    Unlike an unpickled dictionary, nothing is loaded up front - each lookup
+    reads (and decompresses) just the entry asked for. Keys that link to the
+    same entry share a single compressed copy of it.
+    """
+    def __init__(self, store_path: str):
+        uri = f'{Path(store_path).resolve().as_uri()}?mode=ro'
+        self.connection = sqlite3.connect(
+            uri, uri=True, check_same_thread=False)
+        # Stores written before the plural index was added don't have one.
+        self.has_plurals = self.connection.execute(
+            'SELECT 1 FROM sqlite_master WHERE name = \'plurals\''
+        ).fetchone() is not None
+
+    def __contains__(self, key):
+        row = self.connection.execute(
+            'SELECT 1 FROM keys WHERE key = ?', (key,)).fetchone()
+        return row is not None
+
+    def __getitem__(self, key):
+        row = self.connection.execute(
+            'SELECT definitions.xml FROM keys '
+            'JOIN definitions ON definitions.id = keys.definition_id '
+            'WHERE keys.key = ?', (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return zlib.decompress(row[0]).decode('utf-8')
+
+    def __len__(self):
+        return self.connection.execute(
+            'SELECT COUNT(*) FROM keys').fetchone()[0]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def plurals(self, key) -> Optional[List[Tuple[str, str]]]:
+        """The precomputed find_plurals of the entry for `key`.
+
+        Returns None if this store has no plural index.
+        """
+        if not self.has_plurals:
+            return None
+        rows = self.connection.execute(
+            'SELECT plurals.part_of_speech, plurals.plural FROM keys '
+            'JOIN plurals ON plurals.definition_id = keys.definition_id '
+            'WHERE keys.key = ? ORDER BY plurals.rowid', (key,)).fetchall()
+        return [(part_of_speech, plural) for part_of_speech, plural in rows]
+
+    def close(self):
+        self.connection.close()
+
+
+def find_plurals(soup: BeautifulSoup) -> List[Tuple[str, str]]:
+    """(part of speech, plural) for each sense of an entry with a plural."""
+    plurals = []
+    for sense in soup.find_all(class_='gramb x_xd0'):
+        plural_start = sense.find('span', text='Pl. ')
+        if plural_start is not None:
+            part_of_speech = sense.find(class_='ps').text
+            plurals.append(
+                (part_of_speech, plural_start.findNext().text.strip()))
+    return plurals
+
+
+def unpickle_dict(pickle_path: str):
+    with open(pickle_path, 'rb') as file:
+        dictionary = pickle.load(file)
+    return dictionary
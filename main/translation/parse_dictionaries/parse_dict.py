@@ -5,21 +5,31 @@ The function that does the heavy lifting is _parse. Overview:
 
 - The files are just ZIPs of XML entries concatenated with some headers
   inbetween
-- We greedily try to find the ZIPs and extract the XML
+- We greedily try to find the ZIPs and extract the XML. The file is
+  memory-mapped and scanned by offset, jumping between candidate zlib headers,
+  so the scan is linear in the size of the file.
 - Some XML parsing is implemented to find interesting stuff (derivatives for
   example).
 
 """
 import argparse
 import contextlib
-import itertools
+import html
+import mmap
+import multiprocessing
 import os
 import pickle
 import shutil
+import sqlite3
+import struct
 import zlib
-from typing import Dict, List, Tuple, Set
+from typing import Dict, List, Optional, Tuple, Set
 
 import lxml.etree as etree
+from bs4 import BeautifulSoup
+
+from main.translation.parse_dictionaries.dictionary_store import \
+    find_plurals, unpickle_dict
 
 # Matches spans that give some meta info, like "literary", "informal", etc.
 XPATH_INFO = '//span[@class="lg"]/span[@class="reg"]'
@@ -33,6 +43,21 @@ XPATH_DERIVATIVES = '//span[contains(@class, "t_derivatives")]//' \
                     'span[contains(@class, "x_xoh")]/' \
                     'span[@role="text"]'
 
+# Every zlib stream Apple writes starts with this CMF byte (deflate with a 32K
+# window). The FLG byte that follows makes CMF * 256 + FLG a multiple of 31.
+ZLIB_CMF = 0x78
+
+# Compressed data is fed to zlib in chunks of this many bytes, so the unused
+# data zlib hands back after each block is never longer than one chunk.
+DECOMPRESS_CHUNK_SIZE = 64 * 1024
+
+# Apple puts a 12 byte header before each zlib block, starting with the size
+# of the rest of the block: the 8 bytes after it, then the compressed data.
+BLOCK_HEADER = struct.Struct('<III')
+
+# How the name of an entry appears in its opening <d:entry> tag.
+TITLE_ATTRIBUTE = ' d:title="'
+
 GERMAN_ENGLISH = \
     '/System/Library/AssetsV2/' \
     'com_apple_MobileAsset_DictionaryServices_dictionaryOSX/' \
@@ -47,15 +72,29 @@ GERMAN_ENGLISH = \
 #     t = entry.get_xml_tree()
 
 
-def parse(dictionary_path):
+def parse(dictionary_path, workers: int = 1):
+    """Parse Body.data into a dict from keys to pretty-printed XML strings.
+
+    With more than one worker, the blocks are decompressed and split, and the
+    entries are parsed, in a process pool. Everything is merged back in the
+    same order as the serial build, so the result is identical.
+    """
     print(f"Parsing {dictionary_path}...")
-    entries_tuples = _parse(dictionary_path)
-    print('Augmenting...')
-    # Some definitions have multiple entries (for example foil in NOAD).
-    # Merge them here.
-    entries = merge_same_keys(entries_tuples)
-    _get_links(entries)
-    return {k: e.get_xml_tree_string() for k, e in entries.items()}
+    if os.path.getsize(dictionary_path) == 0:
+        # Nothing to parse (and the workers couldn't map it anyway).
+        return {}
+    with _pool(workers, dictionary_path) as pool:
+        entries_tuples = _parse(dictionary_path, pool)
+        print('Augmenting...')
+        # Some definitions have multiple entries (for example foil in NOAD).
+        # Merge them here.
+        entries = merge_same_keys(entries_tuples)
+        _get_links(entries, pool)
+        # Links share their entry's object, so only pretty-print each once.
+        unique = list({id(e): e for e in entries.values()}.values())
+        strings = _map(pool, Entry.get_xml_tree_string, unique)
+        strings = dict(zip(map(id, unique), strings))
+    return {k: strings[id(e)] for k, e in entries.items()}
 
 
 def merge_same_keys(entries_tuples: List[Tuple[str, str]]) -> Dict[str, 'Entry']:
@@ -68,79 +107,214 @@ def merge_same_keys(entries_tuples: List[Tuple[str, str]]) -> Dict[str, 'Entry']
     return entries
 
 
-def _get_links(entries):
+def _get_links(entries, pool=None):
     print('Getting links...')
-    for i, (key, entry) in enumerate(entries.items()):
+    # Take a copy of the items, since we add the links to `entries` as we go.
+    items = list(entries.items())
+    words = _map(pool, Entry.get_sorted_words_and_derivatives,
+                 (entry for _, entry in items))
+    for i, ((key, entry), entry_words) in enumerate(zip(items, words)):
         if i % 1000 == 0:
-            progress = i / len(entries)
+            progress = i / len(items)
             print(f'\rGetting links: {progress * 100:.1f}%', end='', flush=True)
-        for w in entry.get_words_and_derivatives():
+        for w in entry_words:
             if w not in entries:
                 entries[w] = entry
 
 
-def _parse(dictionary_path) -> List[Tuple[str, str]]:
+def _parse(dictionary_path, pool=None) -> List[Tuple[str, str]]:
     """Parse Body.data into a list of entries given as key, definition tuples."""
+    entries = []
     with open(dictionary_path, 'rb') as f:
-        content_bytes = f.read()
-    total_bytes = len(content_bytes)
+        if os.fstat(f.fileno()).st_size == 0:
+            return entries
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as content:
+            total_bytes = len(content)
+            # The first zip file starts at ~100 bytes:
+            if pool is None:
+                blocks = _find_blocks(content, start=100)
+            else:
+                # Here we only find where the blocks are, from their headers,
+                # without decompressing them - the workers do that.
+                blocks = _find_block_ranges(content, start=100)
+            # Close the generator before the mmap, since it holds a view on it.
+            with contextlib.closing(blocks):
+                if pool is None:
+                    splits = (
+                        (offset, _split(block, verbose=i == 0))
+                        for i, (offset, _, block) in enumerate(blocks))
+                else:
+                    ranges = list(blocks)
+                    splits = zip(
+                        (offset for offset, _ in ranges),
+                        pool.imap(_split_block, ranges, chunksize=8))
+                for i, (offset, (new_entries, stop)) in enumerate(splits):
+                    entries += new_entries
+                    if stop:
+                        break
+                    if i % 10 == 0:
+                        progress = offset / total_bytes
+                        print(f'{progress * 100:.1f}% // '
+                              f'{len(entries)} entries parsed // '
+                              f'Latest entry: {entries[-1][0]}')
+    return entries
 
-    # The first zip file starts at ~100 bytes:
-    content_bytes = content_bytes[100:]
 
-    first = True
-    entries = []
-    for i in itertools.count():
-        if not content_bytes:  # Backup condition in case stop is never True.
-            break
-        try:
-            d = zlib.decompressobj()
-            res = d.decompress(content_bytes)
-            new_entries, stop = _split(res, verbose=first)
-            entries += new_entries
-            if stop:
-                break
-            if i % 10 == 0:
-                bytes_left = len(content_bytes)  # Approximately...
-                progress = 1 - bytes_left / total_bytes
-                print(f'{progress * 100:.1f}% // '
-                      f'{len(entries)} entries parsed // '
-                      f'Latest entry: {entries[-1][0]}')
-            first = False
-
-            # Set content_bytes to the unused data so we can start the search for the
-            # next zip file.
-            content_bytes = d.unused_data
-
-        except zlib.error:  # Current content_bytes is not a zipfile -> skip a byte.
-            content_bytes = content_bytes[1:]
+def _pool(workers: int, dictionary_path=None):
+    if workers <= 1:
+        return contextlib.nullcontext()
+    if dictionary_path is None:
+        return multiprocessing.Pool(workers)
+    return multiprocessing.Pool(
+        workers, initializer=_init_worker, initargs=(dictionary_path,))
+
+
+def _map(pool, function, iterable):
+    if pool is None:
+        return map(function, iterable)
+    return pool.imap(function, iterable, chunksize=64)
 
-    return entries
+
+# Each worker in the pool maps the dictionary once, in _init_worker.
+_worker_view = None
+
+
+def _init_worker(dictionary_path):
+    global _worker_view
+    with open(dictionary_path, 'rb') as f:
+        content = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    _worker_view = memoryview(content)
+
+
+def _split_block(block_range: Tuple[int, int]):
+    offset, end = block_range
+    with _worker_view[:end] as view:
+        inflated = _inflate(view, offset)
+    if inflated is None:
+        return [], False
+    return _split(inflated[0], verbose=False)
+
+
+def _find_blocks(content, start: int = 0):
+    """Yield (offset, end, decompressed bytes) for every zlib block.
+
+    `content` can be any buffer, e.g. a memory-mapped Body.data. Rather than
+    stepping one byte at a time, we jump between candidate zlib headers, and
+    the compressed data is handed to zlib as zero-copy memoryview slices.
+    """
+    with memoryview(content) as view:
+        offset = _find_zlib_header(content, start)
+        while offset != -1:
+            inflated = _inflate(view, offset)
+            if inflated is None:
+                # Not actually a zlib block -> try the next candidate.
+                offset = _find_zlib_header(content, offset + 1)
+            else:
+                block, end = inflated
+                yield offset, end, block
+                offset = _find_zlib_header(content, end)
+
+
+def _find_block_ranges(content, start: int = 0):
+    """Yield (offset, end) for every zlib block, without decompressing them.
+
+    Where a block is given by its header, we skip straight to the end of it.
+    If the header doesn't check out (e.g. isn't there), the block is
+    decompressed to find where it ends, as _find_blocks does.
+    """
+    with memoryview(content) as view:
+        offset = _find_zlib_header(content, start)
+        while offset != -1:
+            end = _block_end(content, offset)
+            if end is None:
+                inflated = _inflate(view, offset)
+                if inflated is None:
+                    # Not actually a zlib block -> try the next candidate.
+                    offset = _find_zlib_header(content, offset + 1)
+                    continue
+                _, end = inflated
+            yield offset, end
+            offset = _find_zlib_header(content, end)
+
+
+def _block_end(content, offset: int) -> Optional[int]:
+    """Where the block at `offset` ends according to its header, if it has
+    one that's consistent with the rest of the file (i.e. the block ends at
+    the end of the file or just before another block's header)."""
+    if offset < BLOCK_HEADER.size:
+        return None
+    size, _, _ = BLOCK_HEADER.unpack_from(content, offset - BLOCK_HEADER.size)
+    end = offset + size - 8
+    if end <= offset + 2 or end > len(content):
+        return None
+    if end == len(content):
+        return end
+    if not _is_zlib_header(content, end + BLOCK_HEADER.size):
+        return None
+    return end
+
+
+def _find_zlib_header(content, start: int) -> int:
+    """Return the offset of the next plausible zlib header, or -1."""
+    offset = content.find(bytes([ZLIB_CMF]), start)
+    while offset != -1 and offset + 1 < len(content):
+        if _is_zlib_header(content, offset):
+            return offset
+        offset = content.find(bytes([ZLIB_CMF]), offset + 1)
+    return -1
+
+
+def _is_zlib_header(content, offset: int) -> bool:
+    if offset + 1 >= len(content) or content[offset] != ZLIB_CMF:
+        return False
+    flags = content[offset + 1]
+    # Apple never uses a preset dictionary (FDICT, bit 5 of FLG).
+    return (ZLIB_CMF * 256 + flags) % 31 == 0 and not flags & 0x20
+
+
+def _inflate(view: memoryview, offset: int):
+    """Decompress the zlib stream starting at `offset`.
+
+    Returns a tuple of the decompressed bytes and the offset just past the end
+    of the stream, or None if there is no valid stream at `offset`.
+    """
+    d = zlib.decompressobj()
+    chunks = []
+    position = offset
+    total_bytes = len(view)
+    try:
+        while not d.eof and position < total_bytes:
+            end = min(position + DECOMPRESS_CHUNK_SIZE, total_bytes)
+            with view[position:end] as chunk:
+                chunks.append(d.decompress(chunk))
+            position = end
+    except zlib.error:
+        return None
+    # If the stream is truncated by the end of the file, keep whatever we
+    # managed to decompress, as the greedy whole-file version used to.
+    return b''.join(chunks), position - len(d.unused_data)
 
 
 def _split(input_bytes, verbose) -> Tuple[List[Tuple[str, str]], bool]:
     """Split `input_bytes` into a list of tuples (name, definition)."""
     printv = print if verbose else lambda *a, **k: ...
 
-    # The first four bytes are always not UTF-8 (not sure why?)
-    input_bytes = input_bytes[4:]
-
     printv('Splitting...')
     printv(f'{"index": <10}', f'{"bytes": <30}', f'{"as chars"}',
            '-' * 50, sep='\n')
 
     entries = []
-    total_offset = 0
     stop_further_parsing = False
 
+    # The first four bytes are always not UTF-8 (not sure why?)
+    offset = 4
     while True:
         # Find the next newline, which delimits the current entry.
-        try:
-            next_offset = input_bytes.index('\n'.encode('utf-8'))
-        except ValueError:  # No more new-lines -> no more entries!
+        next_offset = input_bytes.find(b'\n', offset)
+        if next_offset == -1:  # No more new-lines -> no more entries!
             break
 
-        entry_text = input_bytes[:next_offset].decode('utf-8')
+        entry_text = input_bytes[offset:next_offset].decode('utf-8')
 
         # The final part of the dictionary contains some meta info, which we skip.
         # TODO: might only be for the NOAD, so check other dictionaries.
@@ -152,30 +326,45 @@ def _split(input_bytes, verbose) -> Tuple[List[Tuple[str, str]], bool]:
         # Make sure we have a valid entry.
         assert (entry_text.startswith('<d:entry') and
                 entry_text.endswith('</d:entry>')), \
-            f'ENTRY: {entry_text} \n REM: {input_bytes}'
-
-        # The name of the definition is stored in the "d:title" attribute,
-        # where "d" is the current domain, which we get from the nsmap - the
-        # actual attribute will be "{com.apple.blabla}title" (including the
-        # curly brackets).
-        xml_entry = etree.fromstring(entry_text)
-        domain = xml_entry.nsmap['d']
-        key = '{%s}title' % domain
-        name = xml_entry.get(key)  # Lookup the attribute in the tree.
+            f'ENTRY: {entry_text} \n REM: {input_bytes[offset:]}'
 
+        name = _get_title(entry_text)
         entries.append((name, entry_text))
 
-        printv(f'{next_offset + total_offset: 10d}',
+        printv(f'{next_offset: 10d}',
                f'{str(input_bytes[next_offset + 1:next_offset + 5]): <30}',
-               xml_entry.get(key))
+               name)
 
         # There is always 4 bytes of chibberish between entries. Skip them
         # and the new lines (for a total of 5 bytes).
-        input_bytes = input_bytes[next_offset + 5:]
-        total_offset += next_offset
+        offset = next_offset + 5
     return entries, stop_further_parsing
 
 
+def _get_title(entry_text: str) -> str:
+    """Get the name of an entry from its "d:title" attribute.
+
+    Parsing the whole entry just for this is slow, so we look for the
+    attribute in the opening tag directly, and only fall back to lxml if it
+    isn't written the way Apple normally writes it.
+    """
+    opening_tag = entry_text[:entry_text.find('>')]
+    start = opening_tag.find(TITLE_ATTRIBUTE)
+    if start != -1:
+        start += len(TITLE_ATTRIBUTE)
+        end = opening_tag.find('"', start)
+        if end != -1:
+            return html.unescape(opening_tag[start:end])
+    # The name of the definition is stored in the "d:title" attribute,
+    # where "d" is the current domain, which we get from the nsmap - the
+    # actual attribute will be "{com.apple.blabla}title" (including the
+    # curly brackets).
+    xml_entry = etree.fromstring(entry_text)
+    domain = xml_entry.nsmap['d']
+    key = '{%s}title' % domain
+    return xml_entry.get(key)  # Lookup the attribute in the tree.
+
+
 class Entry:
     def __init__(self, key, content):
         self.key = key
@@ -232,6 +421,10 @@ class Entry:
         other_words = set(self.get_special(XPATH_OTHER_WORDS, [("the", "")]))
         return (derivatives | other_words) - {self.key}
 
+    def get_sorted_words_and_derivatives(self):
+        # Sorted, so that links are added in the same order on every build.
+        return sorted(self.get_words_and_derivatives())
+
     def get_info(self):
         return _lazy(self, "_info", lambda: set(self.get_special(XPATH_INFO)))
 
@@ -245,14 +438,107 @@ def _lazy(obj, ivar, creator):
     return getattr(obj, ivar)
 
 
-def pickle_dict(pickle_path: str, dict_path: str):
-    dictionary = parse(dict_path)
+def write_store(
+        store_path: str, dictionary: Dict[str, str], workers: int = 1):
+    """Save `dictionary` as a DictionaryStore at `store_path`."""
+    if os.path.exists(store_path):
+        os.remove(store_path)
+    connection = sqlite3.connect(store_path)
+    with connection:
+        connection.execute(
+            'CREATE TABLE definitions (id INTEGER PRIMARY KEY, xml BLOB)')
+        connection.execute(
+            'CREATE TABLE keys ('
+            'key TEXT PRIMARY KEY, definition_id INTEGER) WITHOUT ROWID')
+        connection.execute(
+            'CREATE TABLE plurals (definition_id INTEGER, '
+            'part_of_speech TEXT, plural TEXT)')
+        definition_ids = {}
+        for key, definition in dictionary.items():
+            if definition not in definition_ids:
+                xml = zlib.compress(definition.encode('utf-8'))
+                cursor = connection.execute(
+                    'INSERT INTO definitions (xml) VALUES (?)', (xml,))
+                definition_ids[definition] = cursor.lastrowid
+            connection.execute(
+                'INSERT INTO keys VALUES (?, ?)',
+                (key, definition_ids[definition]))
+        print('Indexing plurals...')
+        plurals = build_plural_index(list(definition_ids), workers)
+        for definition, definition_plurals in plurals.items():
+            connection.executemany(
+                'INSERT INTO plurals VALUES (?, ?, ?)',
+                [(definition_ids[definition], part_of_speech, plural)
+                 for part_of_speech, plural in definition_plurals])
+        connection.execute(
+            'CREATE INDEX plurals_definition_id '
+            'ON plurals (definition_id)')
+    connection.execute('VACUUM')
+    connection.close()
+
+
+def build_plural_index(
+        definitions: List[str], workers: int = 1
+) -> Dict[str, List[Tuple[str, str]]]:
+    """Map each definition that has any plurals to its find_plurals."""
+    # Cheap check first, so we only parse the entries that can have plurals.
+    definitions = [d for d in definitions if 'Pl. ' in d]
+    with _pool(workers) as pool:
+        plurals = _map(pool, _find_definition_plurals, definitions)
+        return {
+            definition: definition_plurals
+            for definition, definition_plurals in zip(definitions, plurals)
+            if definition_plurals}
+
+
+def _find_definition_plurals(definition: str):
+    return find_plurals(BeautifulSoup(definition, "html.parser"))
+
+
+def pickle_dict(pickle_path: str, dict_path: str, workers: int = 1):
+    dictionary = parse(dict_path, workers)
     with open(pickle_path, 'wb') as file:
         pickle.dump(dictionary, file)
 
 
-def unpickle_dict(pickle_path: str):
-    with open(pickle_path, 'rb') as file:
-        dictionary = pickle.load(file)
-    return dictionary
-
+def store_dict(store_path: str, dict_path: str, workers: int = 1):
+    dictionary = parse(dict_path, workers)
+    write_store(store_path, dictionary, workers)
+
+
+def configure_args():
+    description = \
+        'Pickle an Apple dictionary given as a Body.data file, or save it ' \
+        'as a DictionaryStore'
+    parser = argparse.ArgumentParser(description=description)
+    dictionary_path_help = 'Path to the Body.data file to parse.'
+    parser.add_argument(
+        '--dictionary_path', help=dictionary_path_help, type=str,
+        default=GERMAN_ENGLISH)
+    pickle_path_help = 'Where to save the pickled dictionary.'
+    parser.add_argument(
+        '--pickle_path', help=pickle_path_help, type=str,
+        default=os.path.join(
+            os.path.dirname(__file__), 'apple_german_english.pickle'))
+    store_path_help = \
+        'Save the dictionary as a DictionaryStore at this path instead. ' \
+        'If --from_pickle is given, the pickle is converted rather than ' \
+        'parsing Body.data again.'
+    parser.add_argument('--store_path', help=store_path_help, type=str)
+    from_pickle_help = 'Path to an already pickled dictionary to convert.'
+    parser.add_argument('--from_pickle', help=from_pickle_help, type=str)
+    workers_help = 'Number of processes to parse the dictionary with.'
+    parser.add_argument(
+        '--workers', help=workers_help, type=int, default=1)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = configure_args()
+    if args.store_path is None:
+        pickle_dict(args.pickle_path, args.dictionary_path, args.workers)
+    elif args.from_pickle is not None:
+        write_store(
+            args.store_path, unpickle_dict(args.from_pickle), args.workers)
+    else:
+        store_dict(args.store_path, args.dictionary_path, args.workers)
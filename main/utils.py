@@ -1,11 +1,29 @@
+import argparse
+import codecs
 import hashlib
+import itertools
+import json
 import os
 import time
 from json import JSONEncoder
 from pathlib import Path
-from typing import Any
+from typing import Any, Iterable, Iterator, Union
 
 import psutil
+import requests
+
+from main.HttpClient import HttpClient
+from main.Metrics import Metrics
+
+# Where each service lives. Each can be overridden with an environment
+# variable of the same name, e.g. to point at the load test's stand-ins.
+ANKI_CONNECT_URL = os.environ.get('ANKI_CONNECT_URL', 'http://localhost:8765')
+CRUNCHY_NUT_URL = os.environ.get(
+    'CRUNCHY_NUT_URL', 'https://crunchy-nut-server.herokuapp.com')
+LINGUEE_URL = os.environ.get('LINGUEE_URL', 'https://www.linguee.com')
+VERBFORMEN_URL = os.environ.get('VERBFORMEN_URL', 'https://www.verbformen.de')
+# None means DeepL's own server.
+DEEPL_SERVER_URL = os.environ.get('DEEPL_SERVER_URL')
 
 
 class RecursiveJsonEncoder(JSONEncoder):
@@ -16,43 +34,156 @@ class RecursiveJsonEncoder(JSONEncoder):
             return str(o)
 
 
+def iter_json_array(chunks: Iterable[Union[str, bytes]]) -> Iterator[Any]:
+    # Decodes a JSON array one item at a time as its text arrives (e.g. from
+    # response.iter_content), so we never hold the whole response, or every
+    # object in it, in memory at once.
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    position = 0
+    started = False
+    # None marks the end of the text.
+    for chunk in itertools.chain(chunks, [None]):
+        final = chunk is None
+        if final:
+            chunk = text_decoder.decode(b'', final=True)
+        elif isinstance(chunk, bytes):
+            chunk = text_decoder.decode(chunk)
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\n\r':
+                position += 1
+            if position == len(buffer):
+                break
+            character = buffer[position]
+            if not started:
+                if character != '[':
+                    raise ValueError('Expected a JSON array')
+                started = True
+                position += 1
+            elif character == ']':
+                return
+            elif character == ',':
+                position += 1
+            else:
+                try:
+                    item, end = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    if final:
+                        raise
+                    # Only part of this item has arrived so far.
+                    break
+                if end == len(buffer) and not final:
+                    # A number might carry on into the next chunk.
+                    break
+                yield item
+                position = end
+    raise ValueError('Unterminated JSON array')
+
+
 def project_root():
     return Path(__file__).parent.parent
 
 
-def open_anki():
-    # Open Anki if it isn't open already.
-    processes = [process.name() for process in psutil.process_iter()]
-    # Anki has different name depending on what version, OS, etc.
-    already_open = any(['anki' in process.lower() for process in processes])
+def cache_dir():
+    # Everything we keep between runs (caches and cursors) lives here.
+    return project_root() / 'main' / 'cache'
+
+
+def add_cache_args(parser: argparse.ArgumentParser):
+    no_cache_help = \
+        'Don\'t read or write the translation cache, the page cache or ' \
+        'the conjugation index.'
+    parser.add_argument('--no-cache', help=no_cache_help, action='store_true')
+    refresh_help = \
+        'Translate everything again, ignoring but then updating the ' \
+        'translation cache.'
+    parser.add_argument('--refresh', help=refresh_help, action='store_true')
+
+
+def add_metrics_args(parser: argparse.ArgumentParser):
+    metrics_dir_help = (
+        'Where to write the run\'s metrics, as JSON and as a Prometheus '
+        'textfile.')
+    parser.add_argument(
+        '--metrics-dir', help=metrics_dir_help,
+        default=f'{project_root()}/main/metrics')
+    no_metrics_help = 'Don\'t time or count anything.'
+    parser.add_argument(
+        '--no-metrics', help=no_metrics_help, action='store_true')
+    profile_help = 'Write cProfile stats for the run to this file.'
+    parser.add_argument('--profile', help=profile_help)
+
+
+@Metrics.shared().timed('anki.open')
+def open_anki(deadline: float = 60):
+    # Open Anki if it isn't open already, then wait until AnkiConnect is
+    # answering requests (but no longer than `deadline` seconds). Raises a
+    # RuntimeError if it never does, rather than carrying on without Anki.
+    already_open = len(anki_processes()) > 0
     if not already_open:
         # Apparently this is best done in a subprocess. But this design is
         # temporary so I don't give a fook. Is also Mac specific.
         os.system("open /Applications/Anki.app")
-        # Give it quite a few seconds to open
-        time.sleep(20)
+    if not wait_for_anki(deadline):
+        raise RuntimeError(
+            f'AnkiConnect didn\'t answer at {ANKI_CONNECT_URL} within '
+            f'{deadline}s - is Anki running with AnkiConnect installed?')
     return already_open
 
 
-def close_anki():
+@Metrics.shared().timed('anki.wait')
+def wait_for_anki(deadline: float = 60, delay: float = 0.1):
+    # Poll AnkiConnect's 'version' action, backing off exponentially, until
+    # it answers. Returns whether it did so before the deadline.
+    probe = HttpClient(timeout=(1, 5), retries=0)
+    start = time.monotonic()
+    try:
+        while True:
+            try:
+                data = {'action': 'version', 'version': 6}
+                if probe.post(ANKI_CONNECT_URL, json=data).ok:
+                    return True
+            except requests.RequestException:
+                pass
+            remaining = deadline - (time.monotonic() - start)
+            if remaining <= 0:
+                return False
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 2)
+    finally:
+        probe.close()
+
+
+@Metrics.shared().timed('anki.close')
+def close_anki(timeout: float = 30):
     # If Anki is open, close it.
-    processes = [process.name() for process in psutil.process_iter()]
-    # Anki has different names depending on what version, OS, etc.
-    anki_processes = [process for process in processes if 'anki' in process.lower()]
-    is_open = False
-    anki_process = None
-    if len(anki_processes) == 1:
-        is_open = True
-        anki_process = anki_processes.pop()
-    elif len(anki_processes) > 1:
+    processes = anki_processes()
+    if len(processes) > 1:
         raise AssertionError("Multiple Anki instances running!?")
-    if is_open:
-        # Wait a few seconds in case any other processes need finishing.
-        time.sleep(20)
-        # subprocess.Popen("osascript -e 'quit app \"Anki\"'")
-        # os.system("osascript -e 'quit app \"Anki\"'")
-        os.system(f'pkill "{anki_process}"')
-        # exit_response = self.connector.request('guiExitAnki')
+    if processes:
+        # Ask Anki to quit, so it can finish whatever it's doing first, then
+        # wait for it to actually exit.
+        try:
+            data = {'action': 'guiExitAnki', 'version': 6}
+            HttpClient.shared().post(ANKI_CONNECT_URL, json=data)
+        except requests.RequestException:
+            pass
+        _, alive = psutil.wait_procs(processes, timeout=timeout)
+        for process in alive:
+            process.terminate()
+
+
+def anki_processes():
+    # Anki has different names depending on what version, OS, etc.
+    processes = []
+    for process in psutil.process_iter(['name']):
+        name = process.info['name'] or ''
+        if 'anki' in name.lower():
+            processes.append(process)
+    return processes
 
 
 def anki_id(string: str):
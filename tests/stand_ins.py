@@ -0,0 +1,42 @@
+import contextlib
+import io
+import unittest
+from functools import cached_property
+
+from benchmarks.fakes import FakeAnkiConnect, FakeAuthorizer
+from main.anki.Connector import Connector
+from main.HttpClient import HttpClient
+from main.SharedResources import SharedResources
+
+
+class StandInResources(SharedResources):
+    # No dictionary or caches on disk, and Anki is the stand-in.
+    def __init__(
+            self, anki: FakeAnkiConnect, http: HttpClient, user: str = 'me'):
+        super().__init__(use_cache=False, authorizer=FakeAuthorizer([user]))
+        self.anki = anki
+        self.http = http
+
+    @cached_property
+    def apple_dict(self):
+        return {}
+
+    @cached_property
+    def connector(self):
+        return Connector(http=self.http, url=self.anki.url)
+
+
+class Response:
+    # The parts of a requests.Response that PageCache uses.
+    def __init__(self, status_code: int, content: bytes = b'', headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+
+def silence_logs(test: unittest.TestCase):
+    # Everything logs a lot - keep it out of the test output until the test
+    # is over.
+    logs = contextlib.redirect_stdout(io.StringIO())
+    logs.__enter__()
+    test.addCleanup(logs.__exit__, None, None, None)
@@ -0,0 +1,86 @@
+import tempfile
+import unittest
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks.fakes import FakeAuthorizer
+from benchmarks.fixtures import FIXTURES
+from main.translation.ConjugationIndex import ConjugationIndex
+from main.translation.PageCache import PageCache
+from main.translation.Translation import Translation
+from main.translation.Translator import Translator
+from tests.stand_ins import Response, silence_logs
+
+GEHEN = 'gehen · geht · ging · ist gegangen'
+
+
+class StandInVerbformen:
+    # Stands in for HttpClient, answering verbformen requests with the saved
+    # pages in tests/fixtures/verbformen.
+    def __init__(self):
+        self.urls = []
+
+    def get(self, url: str, **kwargs):
+        self.urls.append(url)
+        verb = parse_qs(urlparse(url).query)['w'][0]
+        path = FIXTURES / 'verbformen' / f'{verb}.html'
+        if not path.exists():
+            return Response(404)
+        return Response(200, path.read_bytes())
+
+
+class TestConjugationIndex(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.conjugations = ConjugationIndex(f'{directory.name}/index.db')
+        self.addCleanup(self.conjugations.connection.close)
+        silence_logs(self)
+
+    def conjugate(self, http: StandInVerbformen, *verbs: str):
+        translator = Translator(
+            'me', apple_dict={}, http=http, conjugations=self.conjugations,
+            authorizer=FakeAuthorizer(['me']))
+        translations = [Translation(verb, 'verb') for verb in verbs]
+        translator.conjugate_verbs(translations)
+        return [translation.conjugation for translation in translations]
+
+    def test_hit_and_miss(self):
+        self.assertIsNone(self.conjugations.get('gehen'))
+        self.conjugations.put('gehen', GEHEN)
+        self.assertEqual(GEHEN, self.conjugations.get(' gehen '))
+        self.assertEqual(1, len(self.conjugations))
+        # 'ä' as one code point, then as 'a' and a combining diaeresis.
+        self.conjugations.put('fährt', 'fahren')
+        self.assertEqual('fahren', self.conjugations.get('fährt'))
+
+    def test_writes_back_what_verbformen_gives(self):
+        http = StandInVerbformen()
+        self.assertEqual(
+            [GEHEN, None], self.conjugate(http, 'gehen', 'xyzzeln'))
+        self.assertEqual(2, len(http.urls))
+        self.assertEqual(GEHEN, self.conjugations.get('gehen'))
+        # Verbs verbformen couldn't conjugate aren't stored.
+        self.assertEqual(1, len(self.conjugations))
+
+    def test_hit_skips_verbformen(self):
+        self.conjugations.put('gehen', GEHEN)
+        http = StandInVerbformen()
+        self.assertEqual([GEHEN], self.conjugate(http, 'gehen'))
+        self.assertEqual([], http.urls)
+
+    def test_import_pages(self):
+        pages = PageCache(f'{self.directory}/pages.db')
+        self.addCleanup(pages.connection.close)
+        translator = Translator(
+            'me', apple_dict={}, http=StandInVerbformen(),
+            authorizer=FakeAuthorizer(['me']))
+        for verb in ['gehen', 'sein']:
+            pages.get(translator.conjugator_url(verb), translator.fetch)
+        self.conjugations.import_pages(pages)
+        self.assertEqual(2, len(self.conjugations))
+        self.assertEqual(GEHEN, self.conjugations.get('gehen'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+import os
+import socket
+import time
+import unittest
+from unittest import mock
+
+from benchmarks.fakes import FakeAnkiConnect
+from main.anki.Connector import Connector
+from main.FlashcardMaker import FlashcardMaker
+from main.HttpClient import HttpClient
+from main.SharedResources import SharedResources
+from main.translation.Translation import Translation
+from main.utils import wait_for_anki
+from tests.stand_ins import StandInResources, silence_logs
+
+
+def closed_url() -> str:
+    # A local URL nothing is listening on.
+    with socket.socket() as closed:
+        closed.bind(('127.0.0.1', 0))
+        return f'http://127.0.0.1:{closed.getsockname()[1]}'
+
+
+class ClosedAnki(StandInResources):
+    # Anki never answers, and the connector is the real one that waits for
+    # it (see the tests, which patch wait_for_anki).
+    connector = SharedResources.connector
+
+
+class TestConnector(unittest.TestCase):
+    def setUp(self):
+        self.http = HttpClient(backoff_factor=0)
+        self.addCleanup(self.http.close)
+        silence_logs(self)
+
+    def flashcard_maker(self, anki: FakeAnkiConnect) -> FlashcardMaker:
+        return FlashcardMaker('me', StandInResources(anki, self.http))
+
+    def test_batch(self):
+        with FakeAnkiConnect() as anki:
+            connector = Connector(http=self.http, url=anki.url)
+            with connector.batch() as batch:
+                batch.request('version')
+                batch.request('findNotes', query='deck:"Fluency Lube"')
+            self.assertEqual([True, True], batch.succeeded)
+            self.assertEqual([6, []], batch.results)
+            self.assertEqual(1, anki.requests['multi'])
+
+    def test_failed_action(self):
+        with FakeAnkiConnect(failures={'sync'}) as anki:
+            connector = Connector(http=self.http, url=anki.url)
+            with connector.batch() as batch:
+                batch.request('version')
+                batch.request('sync')
+            self.assertEqual([True, False], batch.succeeded)
+            self.assertEqual([6, None], batch.results)
+
+    def test_failed_multi_fails_every_action(self):
+        with FakeAnkiConnect(failures={'multi'}) as anki:
+            connector = Connector(http=self.http, url=anki.url)
+            with connector.batch() as batch:
+                batch.request('version')
+                batch.request('sync')
+            self.assertEqual([False, False], batch.succeeded)
+            self.assertEqual([None, None], batch.results)
+
+    def test_update_anki(self):
+        with FakeAnkiConnect() as anki:
+            flashcard_maker = self.flashcard_maker(anki)
+            self.assertTrue(flashcard_maker.update_anki())
+            self.assertEqual([], anki.imported)
+            flashcard_maker.add_note(
+                Translation('Haus', english='house'), 'Fluency Lube')
+            self.assertTrue(flashcard_maker.update_anki())
+            self.assertEqual(1, len(anki.imported))
+            # Only the notes added since are imported next time.
+            self.assertTrue(flashcard_maker.update_anki())
+            self.assertEqual(1, len(anki.imported))
+
+    def test_imports_every_deck_in_one_package(self):
+        notes = [
+            ('Haus', 'house', 'Fluency Lube'),
+            ('gehen', 'to go', 'Verbs'),
+            ('laufen', 'to run', 'Verbs')]
+        with FakeAnkiConnect() as anki:
+            flashcard_maker = self.flashcard_maker(anki)
+            for german, english, deck_name in notes:
+                flashcard_maker.add_note(
+                    Translation(german, english=english), deck_name)
+            self.assertTrue(flashcard_maker.update_anki())
+            self.assertEqual(1, len(anki.imported))
+            self.assertFalse(os.path.exists(anki.imported[0]))
+            self.assertEqual(
+                [(german, deck_name) for german, _, deck_name in notes],
+                [(note['fields']['german'], note['deck'])
+                 for note in anki.imported_notes])
+
+    def test_update_anki_failed_import(self):
+        for failure in ['importPackage', 'multi']:
+            with self.subTest(failure), \
+                    FakeAnkiConnect(failures={failure}) as anki:
+                flashcard_maker = self.flashcard_maker(anki)
+                flashcard_maker.add_note(
+                    Translation('Haus', english='house'), 'Fluency Lube')
+                self.assertFalse(flashcard_maker.update_anki())
+                # Anki's asked again what it has before the next import.
+                self.assertEqual({}, flashcard_maker.existing_notes)
+
+    def test_preflight_skips_existing_notes(self):
+        notes = [
+            {'deck': 'Fluency Lube', 'fields': {
+                'english': 'house', 'german': 'Haus'}},
+            {'deck': 'Other', 'fields': {
+                'english': 'to go', 'german': 'gehen'}}]
+        with FakeAnkiConnect(notes=notes) as anki:
+            flashcard_maker = self.flashcard_maker(anki)
+            self.assertIsNone(flashcard_maker.add_note(
+                Translation('Haus', english='house'), 'Fluency Lube'))
+            # Only the deck it's in counts.
+            self.assertIsNotNone(flashcard_maker.add_note(
+                Translation('gehen', english='to go'), 'Fluency Lube'))
+            # Nor is a note added twice in one run.
+            self.assertIsNone(flashcard_maker.add_note(
+                Translation('gehen', english='to go'), 'Fluency Lube'))
+            self.assertEqual(2, flashcard_maker.skipped)
+            # Each deck is only checked once.
+            self.assertEqual(1, anki.requests['multi'])
+            self.assertEqual(1, anki.requests['notesInfo'])
+            self.assertTrue(flashcard_maker.update_anki())
+            self.assertEqual(0, flashcard_maker.skipped)
+
+    def test_wait_for_anki(self):
+        with FakeAnkiConnect() as anki, \
+                mock.patch('main.utils.ANKI_CONNECT_URL', anki.url):
+            self.assertTrue(wait_for_anki(deadline=1))
+        with mock.patch('main.utils.ANKI_CONNECT_URL', closed_url()):
+            start = time.monotonic()
+            self.assertFalse(wait_for_anki(deadline=0.3))
+            self.assertLess(time.monotonic() - start, 1)
+
+    def test_anki_that_never_answers_is_only_waited_for_once(self):
+        never_answers = mock.patch(
+            'main.utils.wait_for_anki', return_value=False)
+        already_open = mock.patch(
+            'main.utils.anki_processes', return_value=[0])
+        with never_answers as wait, already_open:
+            resources = ClosedAnki(FakeAnkiConnect(), self.http)
+            self.assertFalse(resources.anki_in_use)
+            for user in ['Teague', 'Quinn', 'Ferris']:
+                flashcard_maker = FlashcardMaker(user, resources)
+                flashcard_maker.add_note(
+                    Translation('Haus', english='house'), 'Fluency Lube')
+                self.assertFalse(flashcard_maker.update_anki())
+                # Anki's asked again what it has before the next import.
+                self.assertEqual({}, flashcard_maker.existing_notes)
+            self.assertEqual(1, wait.call_count)
+            # We may have launched Anki, so it still needs closing.
+            self.assertTrue(resources.anki_in_use)
+
+if __name__ == '__main__':
+    unittest.main()
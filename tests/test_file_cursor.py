@@ -0,0 +1,115 @@
+import contextlib
+import hashlib
+import io
+import tempfile
+import unittest
+from unittest import mock
+
+import flashcards_from_file
+from benchmarks.fakes import FakeAnkiConnect, FakeAuthorizer, FakePhraseServer
+from main.FileCursor import FileCursor
+from main.HttpClient import HttpClient
+from main.server.Server import Server
+from main.server.SyncCursor import SyncCursor
+from main.translation.Translation import Translation
+from main.translation.Translator import Translator
+from tests.stand_ins import StandInResources
+
+
+class TestFileCursor(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.cursors = FileCursor(f'{directory.name}/file_cursors.db')
+        self.addCleanup(self.cursors.close)
+        self.path = f'{directory.name}/words.txt'
+        self.write(b'Haus\ngehen\n')
+
+    def write(self, content: bytes):
+        with open(self.path, 'wb') as file:
+            file.write(content)
+
+    def finish(self, offset: int):
+        with open(self.path, 'rb') as file:
+            self.cursors.set(
+                self.path, 'Deck', offset,
+                hashlib.sha256(file.read(offset)))
+
+    def test_starts_at_beginning(self):
+        offset, hasher = self.cursors.get(self.path, 'Deck')
+        self.assertEqual(0, offset)
+        self.assertEqual(hashlib.sha256().hexdigest(), hasher.hexdigest())
+
+    def test_carries_on_after_lines_added(self):
+        self.finish(len(b'Haus\n'))
+        self.write(b'Haus\ngehen\nlaufen\n')
+        offset, hasher = self.cursors.get(self.path, 'Deck')
+        self.assertEqual(len(b'Haus\n'), offset)
+        self.assertEqual(
+            hashlib.sha256(b'Haus\n').hexdigest(), hasher.hexdigest())
+        # Each deck has its own cursor.
+        self.assertEqual(0, self.cursors.get(self.path, 'Other')[0])
+
+    def test_starts_again_if_file_changed(self):
+        self.finish(len(b'Haus\ngehen\n'))
+        self.write(b'Maus\ngehen\n')
+        self.assertEqual(0, self.cursors.get(self.path, 'Deck')[0])
+        self.finish(len(b'Maus\ngehen\n'))
+        self.write(b'Maus\n')
+        self.assertEqual(0, self.cursors.get(self.path, 'Deck')[0])
+
+    def test_reset(self):
+        self.finish(len(b'Haus\n'))
+        self.cursors.reset(self.path, 'Deck')
+        self.assertEqual(0, self.cursors.get(self.path, 'Deck')[0])
+
+    def test_stops_before_line_that_failed_to_translate(self):
+        self.write(b'Haus\ngehen\nlaufen\n')
+        translated = []
+        failures = {'gehen'}
+
+        def translate_many(translator, germans, *args):
+            translated.extend(germans)
+            return [
+                None if german in failures
+                else [Translation(german, english=f'[{german}]')]
+                for german in germans]
+
+        http = HttpClient(backoff_factor=0)
+        self.addCleanup(http.close)
+        args = flashcards_from_file.configure_args(
+            'Deck', [self.path, 'Deck', '--chunk-size', '2'])
+        translations = mock.patch.object(
+            Translator, 'translate_many', translate_many)
+        with FakeAnkiConnect() as anki, \
+                FakePhraseServer(['me'], 0) as phrase_server, \
+                translations, contextlib.redirect_stdout(io.StringIO()):
+            def run():
+                server = Server(
+                    http=http, authorizer=FakeAuthorizer(['me']),
+                    cursors=SyncCursor(f'{self.directory}/cursors.db'),
+                    base_url=phrase_server.url)
+                flashcards_from_file.flashcards_from_file(
+                    args, server, StandInResources(anki, http), self.cursors)
+
+            run()
+            self.assertEqual(['Haus', 'gehen', 'laufen'], translated)
+            self.assertEqual(
+                len(b'Haus\n'), self.cursors.get(self.path, 'Deck')[0])
+            failures.clear()
+            translated.clear()
+            run()
+            # laufen's already on the server, so only gehen is tried again.
+            self.assertEqual(['gehen'], translated)
+            self.assertEqual(
+                len(b'Haus\ngehen\nlaufen\n'),
+                self.cursors.get(self.path, 'Deck')[0])
+            self.assertEqual(
+                ['Haus', 'gehen', 'laufen'],
+                sorted(phrase['german'] for phrase in
+                       phrase_server.phrases['me'].values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+
+from benchmarks.fakes import FakeService
+from main.HttpClient import HttpClient
+from main.Metrics import Metrics
+
+
+class Throttling(FakeService):
+    # Answers the first `failures` requests with a 503, like Linguee does
+    # when it's throttling us.
+    def __init__(self, failures: int):
+        super().__init__()
+        self.failures = failures
+
+    def handle(self, method, path, query, headers, body):
+        with self.lock:
+            self.failures -= 1
+            if self.failures >= 0:
+                return 503, 'text/plain', b'Service Unavailable'
+        return 200, 'text/plain', b'OK'
+
+
+class TestHttpClient(unittest.TestCase):
+    def setUp(self):
+        self.http = HttpClient(backoff_factor=0)
+        self.addCleanup(self.http.close)
+        self.metrics = Metrics.shared()
+        self.metrics.reset()
+        self.metrics.enabled = True
+        self.addCleanup(setattr, self.metrics, 'enabled', False)
+
+    def errors(self, service: FakeService) -> float:
+        host = service.url[len('http://'):]
+        return sum(
+            counter['value']
+            for counter in self.metrics.summary('test')['counters']
+            if counter['name'] == 'http_5xx'
+            and counter['labels']['host'] == host)
+
+    def test_does_not_retry_throttled_host(self):
+        with Throttling(failures=1) as service:
+            response = self.http.get(f'{service.url}/search')
+            self.assertEqual(503, response.status_code)
+            self.assertEqual(1, service.requests['GET /search'])
+            self.assertEqual(1, self.errors(service))
+
+    def test_retries_safe_host_and_counts_each_5xx(self):
+        with Throttling(failures=2) as service:
+            self.http.retry_on_status(service.url)
+            response = self.http.get(f'{service.url}/phrase/')
+            self.assertEqual(200, response.status_code)
+            self.assertEqual(3, service.requests['GET /phrase/'])
+            self.assertEqual(2, self.errors(service))
+
+    def test_counts_last_response_once_when_out_of_retries(self):
+        with Throttling(failures=10) as service:
+            self.http.retry_on_status(service.url)
+            response = self.http.get(f'{service.url}/phrase/')
+            self.assertEqual(503, response.status_code)
+            self.assertEqual(4, service.requests['GET /phrase/'])
+            self.assertEqual(4, self.errors(service))
+
+    def test_does_not_retry_post(self):
+        # Even for a safe host, since the POST may have been handled.
+        with Throttling(failures=1) as service:
+            self.http.retry_on_status(service.url)
+            response = self.http.post(f'{service.url}/phrase/bulk')
+            self.assertEqual(503, response.status_code)
+            self.assertEqual(1, service.requests['POST /phrase/bulk'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import contextlib
+import io
+import json
+import unittest
+
+from benchmarks.fixtures import FIXTURES
+from main.translation.LingueeParser import LingueeParser
+
+LINGUEE_FIXTURES = FIXTURES / 'linguee'
+
+
+def parse(backend: str, name: str, comprehensive: bool = False):
+    with open(LINGUEE_FIXTURES / f'{name}.json', encoding='utf-8') as file:
+        golden = json.load(file)
+    content = (LINGUEE_FIXTURES / f'{name}.html').read_bytes()
+    parser = LingueeParser(backend, comprehensive)
+    with contextlib.redirect_stdout(io.StringIO()):
+        translations = parser.translate(golden['query'], content)
+    return golden, [translation.__dict__ for translation in translations]
+
+
+class TestLingueeParser(unittest.TestCase):
+    # Each page in tests/fixtures/linguee has a golden .json file of the
+    # translations the original html.parser implementation gave for it
+    # (and, for laufen.html, in comprehensive mode too).
+    names = sorted(path.stem for path in LINGUEE_FIXTURES.glob('*.html'))
+
+    def test_backends_match_golden_files(self):
+        for backend in LingueeParser.BACKENDS:
+            for name in self.names:
+                with self.subTest(backend=backend, page=name):
+                    golden, translations = parse(backend, name)
+                    self.assertEqual(golden['translations'], translations)
+
+    def test_comprehensive_adds_non_featured_lemmas(self):
+        # laufen.html has lemmas that aren't featured, which only
+        # comprehensive mode should return.
+        for backend in LingueeParser.BACKENDS:
+            with self.subTest(backend=backend):
+                golden, translations = parse(
+                    backend, 'laufen', comprehensive=True)
+                self.assertEqual(
+                    golden['comprehensive_translations'], translations)
+                self.assertEqual(
+                    golden['translations'],
+                    translations[:len(golden['translations'])])
+                extra = translations[len(golden['translations']):]
+                self.assertEqual(
+                    ['laufen', 'laufend'],
+                    [translation['german'] for translation in extra])
+
+    def test_backends_match_when_comprehensive(self):
+        for name in self.names:
+            with self.subTest(page=name):
+                _, expected = parse('html.parser', name, comprehensive=True)
+                _, translations = parse('lxml', name, comprehensive=True)
+                self.assertEqual(expected, translations)
+
+    def test_page_without_elements(self):
+        # Like leer.html (only a comment), lxml can't parse an empty or
+        # blank page at all.
+        for backend in LingueeParser.BACKENDS:
+            for content in [b'', b' \n ']:
+                with self.subTest(backend=backend, content=content):
+                    parser = LingueeParser(backend)
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        self.assertEqual([], parser.translate('leer', content))
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            LingueeParser('html5lib')
+
+
+if __name__ == '__main__':
+    unittest.main()
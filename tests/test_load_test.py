@@ -0,0 +1,32 @@
+import json
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from main.utils import project_root
+
+
+class TestLoadTest(unittest.TestCase):
+    # The load test has to import the pipeline itself (after pointing it at
+    # the stand-ins), so it's run in its own process.
+    def test_flashcards_every_phrase(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = f'{directory}/report.json'
+            subprocess.run(
+                [sys.executable, '-m', 'benchmarks.load_test',
+                 '--users', '2', '--phrases', '8', '--output', output],
+                cwd=project_root(), check=True, capture_output=True,
+                timeout=120)
+            with open(output) as file:
+                report = json.load(file)
+        self.assertEqual(16, report['flashcarded'])
+        self.assertEqual(2, report['services']['anki']['imported'])
+        stages = {stage['name'] for stage in report['stages']}
+        self.assertLessEqual(
+            {'server.get_phrases', 'linguee.fetch', 'anki.update',
+             'server.post_phrases'}, stages)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import tempfile
+import time
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+from main.logs.LogWriter import LogWriter
+
+
+class TestLogWriter(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        # Long enough that only flush() or close() write anything out.
+        self.writer = LogWriter(directory.name, flush_interval=60)
+        self.addCleanup(self.writer.close)
+
+    def path(self, when: float) -> Path:
+        date = datetime.fromtimestamp(when).strftime('%Y_%m_%d')
+        return self.directory / f'{date}.txt'
+
+    def test_buffers_until_flushed(self):
+        self.writer.write('\nZuhause')
+        path = self.path(time.time())
+        self.assertEqual('', path.read_text(encoding='utf-8'))
+        self.writer.flush()
+        self.assertEqual('\nZuhause', path.read_text(encoding='utf-8'))
+
+    def test_rotates_at_midnight(self):
+        self.writer.write('\nheute')
+        today = self.writer.rotate_at - 1
+        tomorrow = self.writer.rotate_at
+        self.writer.rotate(tomorrow)
+        self.writer.write('\nmorgen')
+        self.writer.close()
+        self.assertEqual(
+            '\nheute', self.path(today).read_text(encoding='utf-8'))
+        self.assertEqual(
+            '\nmorgen', self.path(tomorrow).read_text(encoding='utf-8'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from main.Metrics import Metrics
+
+
+class TestMetrics(unittest.TestCase):
+    def test_disabled_records_nothing(self):
+        metrics = Metrics()
+        with metrics.span('linguee.fetch'):
+            pass
+        metrics.count('http_requests', host='www.linguee.com')
+        self.assertEqual({}, metrics.spans)
+        self.assertEqual({}, metrics.counters)
+
+    def test_spans_and_counters(self):
+        metrics = Metrics(enabled=True)
+
+        @metrics.timed('conjugate_verbs')
+        def conjugate():
+            return 'ging'
+
+        self.assertEqual('ging', conjugate())
+        self.assertEqual('ging', conjugate())
+        metrics.count('http_requests', host='www.linguee.com')
+        metrics.count('http_response_bytes', 300, host='www.linguee.com')
+        metrics.count('http_response_bytes', 200, host='www.linguee.com')
+        summary = metrics.summary('test')
+        self.assertEqual(
+            [('conjugate_verbs', 2)],
+            [(span['name'], span['calls']) for span in summary['spans']])
+        self.assertIn(
+            {'name': 'http_response_bytes',
+             'labels': {'host': 'www.linguee.com'}, 'value': 500},
+            summary['counters'])
+
+    def test_run_writes_json_and_textfile(self):
+        metrics = Metrics()
+        with tempfile.TemporaryDirectory() as directory:
+            profile = f'{directory}/run.prof'
+            with metrics.run('test', directory, profile):
+                metrics.count('http_5xx', host='www.linguee.com', status=503)
+            self.assertFalse(metrics.enabled)
+            self.assertTrue(Path(profile).exists())
+            with open(f'{directory}/test.json') as file:
+                summary = json.load(file)
+            textfile = Path(directory, 'test.prom').read_text()
+        self.assertEqual(['run'], [span['name'] for span in summary['spans']])
+        self.assertIn('# TYPE flashcards_http_5xx gauge', textfile)
+        self.assertIn(
+            'flashcards_http_5xx{job="test",host="www.linguee.com",'
+            'status="503"} 1', textfile)
+
+
+if __name__ == '__main__':
+    unittest.main()
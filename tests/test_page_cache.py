@@ -0,0 +1,130 @@
+import tempfile
+import unittest
+from unittest import mock
+
+from main.translation.PageCache import PageCache
+from tests.stand_ins import Response, silence_logs
+
+
+class StandInSite:
+    # Fetches pages for PageCache, remembering what it was asked for. Each
+    # page's ETag is its content.
+    def __init__(self, pages):
+        self.pages = pages
+        self.requests = []
+
+    def get(self, url: str, headers=None):
+        headers = headers or {}
+        self.requests.append((url, headers))
+        content = self.pages.get(url)
+        if content is None:
+            return Response(404)
+        etag = f'"{content.decode()}"'
+        if headers.get('If-None-Match') == etag:
+            return Response(304)
+        return Response(200, content, {'ETag': etag})
+
+
+class TestPageCache(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = f'{directory.name}/pages.db'
+        self.site = StandInSite({
+            'https://www.linguee.com/Haus': b'Haus',
+            'https://www.linguee.com/Maus': b'Maus',
+            'https://www.linguee.com/Laus': b'Laus'})
+        # Time only moves when we say so.
+        self.now = 1_000_000.0
+        clock = mock.patch(
+            'main.translation.PageCache.time.time', lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+        silence_logs(self)
+
+    def cache(self, **kwargs) -> PageCache:
+        cache = PageCache(self.path, **kwargs)
+        self.addCleanup(cache.connection.close)
+        return cache
+
+    def get(self, cache: PageCache, name: str):
+        return cache.get(f'https://www.linguee.com/{name}', self.site.get)
+
+    def test_serves_fresh_pages_from_cache(self):
+        cache = self.cache(max_age=60)
+        self.assertEqual(b'Haus', self.get(cache, 'Haus').content)
+        self.now += 60
+        page = self.get(cache, 'Haus')
+        self.assertEqual((200, b'Haus'), (page.status_code, page.content))
+        self.assertEqual(1, len(self.site.requests))
+
+    def test_revalidates_stale_pages(self):
+        cache = self.cache(max_age=60)
+        self.get(cache, 'Haus')
+        self.now += 61
+        page = self.get(cache, 'Haus')
+        self.assertEqual((200, b'Haus'), (page.status_code, page.content))
+        self.assertEqual(
+            {'If-None-Match': '"Haus"'}, self.site.requests[-1][1])
+        # The 304 counts as fetching it again.
+        self.get(cache, 'Haus')
+        self.assertEqual(2, len(self.site.requests))
+        # If it's changed, we get (and keep) the new page.
+        self.now += 61
+        self.site.pages['https://www.linguee.com/Haus'] = b'Haus2'
+        self.assertEqual(b'Haus2', self.get(cache, 'Haus').content)
+        self.assertEqual(
+            b'Haus2', cache.content('https://www.linguee.com/Haus'))
+
+    def test_does_not_cache_errors(self):
+        cache = self.cache()
+        self.assertEqual(404, self.get(cache, 'Xylophon').status_code)
+        self.assertEqual([], cache.urls())
+
+    def test_evicts_past_max_pages(self):
+        cache = self.cache(max_pages=2)
+        for name in ['Haus', 'Maus']:
+            self.get(cache, name)
+            self.now += 1
+        # Reading Haus makes Maus the least recently used.
+        self.get(cache, 'Haus')
+        self.now += 1
+        self.get(cache, 'Laus')
+        self.assertEqual(
+            ['https://www.linguee.com/Haus', 'https://www.linguee.com/Laus'],
+            cache.urls())
+
+    def test_evicts_past_max_bytes(self):
+        cache = self.cache()
+        self.get(cache, 'Haus')
+        size = cache.total_bytes()
+        cache.max_bytes = 2 * size
+        for name in ['Maus', 'Laus']:
+            self.now += 1
+            self.get(cache, name)
+        self.assertEqual(
+            ['https://www.linguee.com/Laus', 'https://www.linguee.com/Maus'],
+            cache.urls())
+        self.assertLessEqual(cache.total_bytes(), 2 * size)
+
+    def test_identical_pages_stored_once(self):
+        cache = self.cache()
+        self.site.pages['https://www.linguee.com/Maus'] = b'Haus'
+        self.get(cache, 'Haus')
+        self.get(cache, 'Maus')
+        blobs, = cache.connection.execute(
+            'SELECT COUNT(*) FROM blobs').fetchone()
+        self.assertEqual(1, blobs)
+
+    def test_offline(self):
+        self.get(self.cache(max_age=60), 'Haus')
+        self.now += 61
+        offline = self.cache(max_age=60, offline=True)
+        # Stale pages are served anyway, and nothing else is fetched.
+        self.assertEqual(b'Haus', self.get(offline, 'Haus').content)
+        self.assertEqual(404, self.get(offline, 'Maus').status_code)
+        self.assertEqual(1, len(self.site.requests))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,211 @@
+import contextlib
+import io
+import tempfile
+import unittest
+import sqlite3
+import subprocess
+import sys
+import zlib
+
+from bs4 import BeautifulSoup
+
+from benchmarks.fakes import FakeAuthorizer
+from benchmarks.fixtures import FIXTURES, NAMESPACE, synthetic_block, \
+    synthetic_body_data, synthetic_entry
+from benchmarks.legacy import legacy_parse, legacy_split
+from main.translation.parse_dictionaries import parse_dict
+from main.translation.parse_dictionaries.dictionary_store import \
+    DictionaryStore, find_plurals
+from main.translation.Translation import Translation
+from main.translation.Translator import Translator
+from main.utils import project_root
+
+BODY_DATA = str(FIXTURES / 'dictionary' / 'Body.data')
+
+
+def parse(path: str, workers: int = 1):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return parse_dict.parse(path, workers)
+
+
+class TestParseDict(unittest.TestCase):
+    def test_matches_legacy_parse(self):
+        with tempfile.TemporaryDirectory() as directory:
+            synthetic = synthetic_body_data(f'{directory}/Body.data', 20, 10)
+            # Junk between the blocks, which the legacy parser skipped a
+            # byte at a time.
+            blocks = [
+                zlib.compress(synthetic_block(
+                    [synthetic_entry(n) for n in range(b * 5, b * 5 + 5)]))
+                for b in range(4)]
+            junk = f'{directory}/Junk.data'
+            with open(junk, 'wb') as file:
+                file.write(bytes(100) + b'junk'.join(blocks) + b'tail')
+            for path in [BODY_DATA, synthetic, junk]:
+                with self.subTest(path=path):
+                    self.assertEqual(
+                        legacy_parse(path), parse_dict._parse(path))
+
+    def test_workers_match_serial(self):
+        serial = parse(BODY_DATA)
+        self.assertGreater(len(serial), 1000)
+        parallel = parse(BODY_DATA, workers=2)
+        self.assertEqual(serial, parallel)
+        self.assertEqual(list(serial), list(parallel))
+
+    def test_empty_file(self):
+        with tempfile.NamedTemporaryFile(suffix='.data') as file:
+            for workers in [1, 2]:
+                with self.subTest(workers=workers):
+                    self.assertEqual({}, parse(file.name, workers))
+
+    def test_block_ranges_without_headers(self):
+        # Blocks with no (or the wrong) header are found by decompressing
+        # them instead.
+        blocks = [
+            zlib.compress(synthetic_block([synthetic_entry(n)]))
+            for n in range(3)]
+        content = bytes(100) + b'junk'.join(blocks) + b'tail'
+        expected = [
+            (offset, end)
+            for offset, end, _ in parse_dict._find_blocks(content, 100)]
+        self.assertEqual(3, len(expected))
+        self.assertEqual(
+            expected, list(parse_dict._find_block_ranges(content, 100)))
+
+    def test_block_ranges_from_headers(self):
+        with open(BODY_DATA, 'rb') as file:
+            content = file.read()
+        expected = [
+            (offset, end)
+            for offset, end, _ in parse_dict._find_blocks(content, 100)]
+        self.assertEqual(
+            expected, list(parse_dict._find_block_ranges(content, 100)))
+
+    def test_split_matches_legacy_split(self):
+        advisory = '<d:entry d:title="fbm_AdvisoryBoard"></d:entry>'
+        for entries, stop in [
+                ([synthetic_entry(n) for n in range(5)], False),
+                ([synthetic_entry(0), advisory, synthetic_entry(1)], True)]:
+            block = synthetic_block(entries)
+            with self.subTest(stop=stop), \
+                    contextlib.redirect_stdout(io.StringIO()):
+                self.assertEqual(
+                    legacy_split(block), parse_dict._split(block, False))
+                self.assertEqual(stop, parse_dict._split(block, False)[1])
+
+    def test_get_title(self):
+        entries = {
+            # As Apple writes them.
+            f'<d:entry xmlns:d="{NAMESPACE}" id="1" d:title="Haus">'
+            f'</d:entry>': 'Haus',
+            f'<d:entry xmlns:d="{NAMESPACE}" d:title="Tom &amp; Jerry" '
+            f'id="2"></d:entry>': 'Tom & Jerry',
+            # Not as Apple writes them, so lxml has to find the title.
+            f'<d:entry xmlns:d="{NAMESPACE}" id="3" d:title=\'Maus\'>'
+            f'</d:entry>': 'Maus',
+            f'<d:entry xmlns:d="{NAMESPACE}" id="4"\n  d:title="Klaus">'
+            f'</d:entry>': 'Klaus'}
+        for entry_text, title in entries.items():
+            with self.subTest(entry_text=entry_text):
+                self.assertEqual(title, parse_dict._get_title(entry_text))
+
+
+class TestDictionaryStore(unittest.TestCase):
+    # Writing the store is slow, so it's only done once.
+    @classmethod
+    def setUpClass(cls):
+        directory = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(directory.cleanup)
+        cls.dictionary = parse(BODY_DATA)
+        cls.path = f'{directory.name}/apple_german_english.sqlite'
+        with contextlib.redirect_stdout(io.StringIO()):
+            parse_dict.write_store(cls.path, cls.dictionary)
+        cls.store = DictionaryStore(cls.path)
+        cls.addClassCleanup(cls.store.close)
+
+    def test_round_trip(self):
+        self.assertEqual(len(self.dictionary), len(self.store))
+        for key, definition in self.dictionary.items():
+            self.assertIn(key, self.store)
+            self.assertEqual(definition, self.store[key])
+        self.assertNotIn('Xylophonwort', self.store)
+        self.assertIsNone(self.store.get('Xylophonwort'))
+        with self.assertRaises(KeyError):
+            self.store['Xylophonwort']
+
+    def test_links_share_a_definition(self):
+        definitions = self.store.connection.execute(
+            'SELECT COUNT(*) FROM definitions').fetchone()[0]
+        self.assertEqual(len(set(self.dictionary.values())), definitions)
+        self.assertLess(definitions, len(self.store))
+
+    def test_plurals_match_entries(self):
+        with_plurals = 0
+        for key, definition in list(self.dictionary.items())[:200]:
+            expected = find_plurals(
+                BeautifulSoup(definition, 'html.parser'))
+            self.assertEqual(expected, self.store.plurals(key))
+            with_plurals += bool(expected)
+        self.assertGreater(with_plurals, 0)
+
+    def test_store_without_plurals(self):
+        # Stores written before the plural index was added.
+        with tempfile.TemporaryDirectory() as directory:
+            path = f'{directory}/old.sqlite'
+            connection = sqlite3.connect(path)
+            with connection:
+                connection.executescript(
+                    f'ATTACH DATABASE \'{self.path}\' AS new;'
+                    'CREATE TABLE definitions AS '
+                    'SELECT * FROM new.definitions;'
+                    'CREATE TABLE keys AS SELECT * FROM new.keys;')
+            connection.close()
+            store = DictionaryStore(path)
+            self.addCleanup(store.close)
+            self.assertIsNone(store.plurals('Wort0'))
+            # The translator works the plurals out from the entries instead.
+            with_store, with_dict = [
+                Translator(
+                    'me', apple_dict=apple_dict,
+                    authorizer=FakeAuthorizer(['me']))
+                for apple_dict in [store, self.dictionary]]
+            with contextlib.redirect_stdout(io.StringIO()):
+                self.assertEqual(
+                    with_dict.find_plurals('Wort0'),
+                    with_store.find_plurals('Wort0'))
+
+    def test_noun_plurals_match_dict(self):
+        def pluralise(apple_dict):
+            translator = Translator(
+                'me', apple_dict=apple_dict,
+                authorizer=FakeAuthorizer(['me']))
+            nouns = [
+                Translation(f'Wort{n}', category=f'noun, {gender}')
+                for n, gender in enumerate(
+                    ['masculine', 'feminine', 'neuter', 'masculine'])]
+            nouns.append(Translation('Xylophonwort', category='noun, neuter'))
+            with contextlib.redirect_stdout(io.StringIO()):
+                return [noun.plural for noun in
+                        translator.add_noun_plurals(nouns)]
+
+        plurals = pluralise(self.store)
+        self.assertEqual(pluralise(self.dictionary), plurals)
+        self.assertEqual('Wort0e', plurals[0])
+        self.assertEqual('?', plurals[-1])
+
+    def test_translator_leaves_parsing_out(self):
+        # Only building a dictionary needs parse_dict (and multiprocessing).
+        code = (
+            'import sys\n'
+            'import main.translation.Translator\n'
+            'print(\'main.translation.parse_dictionaries.parse_dict\' '
+            'in sys.modules)')
+        output = subprocess.run(
+            [sys.executable, '-c', code], cwd=project_root(), check=True,
+            capture_output=True, text=True).stdout
+        self.assertEqual('False', output.strip())
+
+
+if __name__ == '__main__':
+    unittest.main()
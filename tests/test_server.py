@@ -0,0 +1,188 @@
+import json
+import tempfile
+import unittest
+
+import requests
+
+from benchmarks.fakes import FakeAuthorizer, FakePhraseServer
+from main.HttpClient import HttpClient
+from main.server.Server import Server
+from main.server.SyncCursor import SyncCursor
+from main.utils import iter_json_array
+from tests.stand_ins import silence_logs
+
+
+class GarbledBulk(FakePhraseServer):
+    # Answers every bulk post with `body`, rather than a result per phrase.
+    def __init__(self, users, body: bytes):
+        super().__init__(users)
+        self.body = body
+
+    def handle(self, method, path, query, headers, body):
+        if path != '/phrase/bulk':
+            return super().handle(method, path, query, headers, body)
+        with self.lock:
+            self.posts.append(path)
+        return 200, 'application/json', self.body
+
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cursors = SyncCursor(f'{directory.name}/cursors.db')
+        self.addCleanup(self.cursors.close)
+        self.http = HttpClient()
+        self.addCleanup(self.http.close)
+        silence_logs(self)
+
+    def server(self, stand_in: FakePhraseServer) -> Server:
+        return Server(
+            http=self.http, authorizer=FakeAuthorizer(['Teague']),
+            cursors=self.cursors, base_url=stand_in.url, page_size=2,
+            chunk_size=16, bulk_size=2)
+
+    def posted_phrases(self, stand_in: FakePhraseServer, germans):
+        for german in germans:
+            stand_in.add(german)
+        server = self.server(stand_in)
+        return server, server.get_phrases('Teague', incremental=False)
+
+    def test_pages_through_all_phrases(self):
+        with FakePhraseServer(['Teague']) as stand_in:
+            for german in ['eins', 'zwei', 'drei', 'vier', 'fünf']:
+                stand_in.add(german)
+            phrases = self.server(stand_in).get_phrases('Teague')
+        self.assertEqual(
+            ['eins', 'zwei', 'drei', 'vier', 'fünf'],
+            [phrase.german for phrase in phrases])
+        self.assertEqual(3, len(stand_in.queries))
+
+    def test_only_asks_for_new_phrases(self):
+        with FakePhraseServer(['Teague']) as stand_in:
+            server = self.server(stand_in)
+            for german in ['eins', 'zwei', 'drei']:
+                stand_in.add(german)
+            phrases = server.get_phrases('Teague')
+            server.advance_cursor('Teague', phrases, phrases)
+            stand_in.queries.clear()
+            self.assertEqual([], server.get_phrases('Teague'))
+            self.assertEqual(1, len(stand_in.queries))
+            self.assertEqual(phrases[-1].id, stand_in.queries[0]['after'])
+            stand_in.add('vier')
+            phrases = server.get_phrases('Teague')
+        self.assertEqual(['vier'], [phrase.german for phrase in phrases])
+
+    def test_retries_from_first_failed_phrase(self):
+        with FakePhraseServer(['Teague']) as stand_in:
+            server = self.server(stand_in)
+            for german in ['eins', 'zwei', 'drei']:
+                stand_in.add(german)
+            phrases = server.get_phrases('Teague')
+            done = [phrases[0], phrases[2]]
+            server.advance_cursor('Teague', phrases, done)
+            phrases = server.get_phrases('Teague')
+        self.assertEqual(
+            ['zwei', 'drei'], [phrase.german for phrase in phrases])
+
+    def test_full_sync_ignores_cursor(self):
+        with FakePhraseServer(['Teague']) as stand_in:
+            server = self.server(stand_in)
+            for german in ['eins', 'zwei', 'drei']:
+                stand_in.add(german)
+            phrases = server.get_phrases('Teague')
+            server.advance_cursor('Teague', phrases, phrases)
+            phrases = server.get_phrases('Teague', incremental=False)
+        self.assertEqual(3, len(phrases))
+
+    def test_retries_unavailable_server(self):
+        http = HttpClient(backoff_factor=0)
+        self.addCleanup(http.close)
+        with FakePhraseServer(['Teague'], error_rate=1) as stand_in:
+            server = Server(
+                http=http, authorizer=FakeAuthorizer(['Teague']),
+                cursors=self.cursors, base_url=stand_in.url)
+            with self.assertRaises(requests.HTTPError):
+                server.get_phrases('Teague')
+        # The first try, then three retries.
+        self.assertEqual(4, stand_in.requests['GET /phrase/'])
+
+    def test_server_without_pagination(self):
+        with FakePhraseServer(['Teague'], paginates=False) as stand_in:
+            server = self.server(stand_in)
+            for german in ['eins', 'zwei', 'drei']:
+                stand_in.add(german)
+            phrases = server.get_phrases('Teague')
+            server.advance_cursor('Teague', phrases, phrases[:1])
+            stand_in.add('vier')
+            phrases = server.get_phrases('Teague')
+        self.assertEqual(
+            ['zwei', 'drei', 'vier'], [phrase.german for phrase in phrases])
+
+    def test_posts_phrases_in_bulk(self):
+        germans = ['eins', 'zwei', 'drei', 'vier', 'fünf']
+        with FakePhraseServer(['Teague']) as stand_in:
+            server, phrases = self.posted_phrases(stand_in, germans)
+            failed = server.post_phrases(phrases)
+        self.assertEqual([], failed)
+        self.assertEqual(germans, stand_in.posted)
+        self.assertEqual(['/phrase/bulk'] * 3, stand_in.posts)
+
+    def test_retries_only_failed_phrases(self):
+        with FakePhraseServer(['Teague']) as stand_in:
+            server, phrases = self.posted_phrases(stand_in, ['eins', 'zwei'])
+            stand_in.failures.add('zwei')
+            failed = server.post_phrases(phrases)
+        self.assertEqual([], failed)
+        self.assertEqual(['eins', 'zwei'], stand_in.posted)
+        self.assertEqual(['/phrase/bulk'] * 2, stand_in.posts)
+
+    def test_gives_back_phrases_that_keep_failing(self):
+        with FakePhraseServer(['Teague']) as stand_in:
+            server, phrases = self.posted_phrases(stand_in, ['eins', 'zwei'])
+            stand_in.failures.add('zwei')
+            failed = server.post_phrases(phrases, retries=0)
+        self.assertEqual(['zwei'], [phrase.german for phrase in failed])
+
+    def test_falls_back_to_posting_each_phrase(self):
+        germans = ['eins', 'zwei', 'drei']
+        with FakePhraseServer(['Teague'], bulk=False) as stand_in:
+            server, phrases = self.posted_phrases(stand_in, germans)
+            stand_in.failures.add('zwei')
+            failed = server.post_phrases(phrases)
+        self.assertEqual(['zwei'], [phrase.german for phrase in failed])
+        self.assertEqual(['eins', 'drei'], stand_in.posted)
+        self.assertEqual(
+            ['/phrase/bulk'] + [f'/phrase/{phrase.id}' for phrase in phrases],
+            stand_in.posts)
+
+    def test_falls_back_when_bulk_results_are_unreadable(self):
+        for body in [b'<html></html>', b'[1, 2]', b'{"ok": true}']:
+            with self.subTest(body=body), \
+                    GarbledBulk(['Teague'], body) as stand_in:
+                server, phrases = self.posted_phrases(
+                    stand_in, ['eins', 'zwei'])
+                self.assertEqual([], server.post_phrases(phrases))
+                self.assertEqual(['eins', 'zwei'], stand_in.posted)
+                self.assertEqual(
+                    ['/phrase/bulk'] * 3
+                    + [f'/phrase/{phrase.id}' for phrase in phrases],
+                    stand_in.posts)
+
+
+class TestIterJsonArray(unittest.TestCase):
+    def test_items_split_across_chunks(self):
+        items = [{'german': 'Häuschen', 'n': 12}, [], 'ß', 345, None]
+        data = json.dumps(items, ensure_ascii=False).encode('utf-8')
+        for size in [1, 2, 3, 7, len(data)]:
+            with self.subTest(size=size):
+                chunks = [data[i:i + size] for i in range(0, len(data), size)]
+                self.assertEqual(items, list(iter_json_array(chunks)))
+
+    def test_unterminated_array(self):
+        with self.assertRaises(ValueError):
+            list(iter_json_array(['[1, 2']))
+
+
+if __name__ == '__main__':
+    unittest.main()
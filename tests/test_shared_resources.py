@@ -0,0 +1,64 @@
+import unittest
+from unittest import mock
+
+from main.SharedResources import SharedResources
+
+RESOURCES = {
+    'apple_dict': 'Translator.load_apple_dict',
+    'translation_cache': 'TranslationCache',
+    'page_cache': 'PageCache',
+    'conjugations': 'ConjugationIndex',
+    'model': 'NoteTaker.default_model',
+    'connector': 'Connector'}
+
+
+class TestSharedResources(unittest.TestCase):
+    def setUp(self):
+        # Stand-ins for whatever builds each resource, and for opening Anki.
+        self.makers = {}
+        for name, target in RESOURCES.items():
+            patch = mock.patch(f'main.SharedResources.{target}')
+            self.makers[name] = patch.start()
+            self.addCleanup(patch.stop)
+        patch = mock.patch(
+            'main.SharedResources.open_anki', return_value=True)
+        self.open_anki = patch.start()
+        self.addCleanup(patch.stop)
+        logs = mock.patch('main.SharedResources.log')
+        logs.start()
+        self.addCleanup(logs.stop)
+
+    def test_nothing_is_built_until_needed(self):
+        resources = SharedResources()
+        for maker in self.makers.values():
+            maker.assert_not_called()
+        self.open_anki.assert_not_called()
+        self.assertFalse(resources.anki_in_use)
+
+    def test_each_resource_is_built_once(self):
+        resources = SharedResources()
+        for name, maker in self.makers.items():
+            with self.subTest(resource=name):
+                resource = getattr(resources, name)
+                self.assertIs(resource, getattr(resources, name))
+                maker.assert_called_once()
+        self.open_anki.assert_called_once()
+
+    def test_anki_in_use_once_connected(self):
+        resources = SharedResources()
+        resources.translation_cache
+        self.assertFalse(resources.anki_in_use)
+        resources.connector
+        self.assertTrue(resources.anki_in_use)
+
+    def test_no_caches(self):
+        resources = SharedResources(use_cache=False)
+        self.assertIsNone(resources.translation_cache)
+        self.assertIsNone(resources.page_cache)
+        self.assertIsNone(resources.conjugations)
+        for name in ['translation_cache', 'page_cache', 'conjugations']:
+            self.makers[name].assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
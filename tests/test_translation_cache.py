@@ -0,0 +1,81 @@
+import tempfile
+import unittest
+from unittest import mock
+
+from main.translation.Translation import Translation
+from main.translation.TranslationCache import TranslationCache
+
+
+class TestTranslationCache(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = f'{directory.name}/translations.db'
+        # Time only moves when we say so.
+        self.now = 1_000_000.0
+        clock = mock.patch(
+            'main.translation.TranslationCache.time.time',
+            lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def cache(self, **kwargs) -> TranslationCache:
+        cache = TranslationCache(self.path, **kwargs)
+        self.addCleanup(cache.connection.close)
+        return cache
+
+    @staticmethod
+    def house():
+        return [Translation('Haus', 'noun, neuter', english='house')]
+
+    def test_hit_and_miss(self):
+        cache = self.cache()
+        self.assertIsNone(cache.get('Haus', 'linguee'))
+        cache.put('Haus', 'linguee', self.house())
+        translations = cache.get('  Haus ', 'linguee')
+        self.assertEqual(
+            [translation.__dict__ for translation in self.house()],
+            [translation.__dict__ for translation in translations])
+        # Each source is cached separately.
+        self.assertIsNone(cache.get('Haus', 'deepl'))
+
+    def test_normalises_phrases(self):
+        cache = self.cache()
+        cache.put('sich etw.\tansehen  H\u00e4user', 'linguee', self.house())
+        self.assertIsNotNone(
+            cache.get('sich etw. ansehen Ha\u0308user', 'linguee'))
+
+    def test_expires_after_ttl(self):
+        cache = self.cache(ttl=60)
+        cache.put('Haus', 'linguee', self.house())
+        self.now += 60
+        self.assertIsNotNone(cache.get('Haus', 'linguee'))
+        self.now += 1
+        self.assertIsNone(cache.get('Haus', 'linguee'))
+        # Expired translations are deleted, not just ignored.
+        self.now -= 61
+        self.assertIsNone(cache.get('Haus', 'linguee'))
+
+    def test_evicts_least_recently_used(self):
+        cache = self.cache(max_entries=2)
+        for german in ['Haus', 'Maus']:
+            cache.put(german, 'linguee', self.house())
+            self.now += 1
+        # Reading Haus makes Maus the least recently used.
+        self.assertIsNotNone(cache.get('Haus', 'linguee'))
+        self.now += 1
+        cache.put('Laus', 'linguee', self.house())
+        self.assertIsNotNone(cache.get('Haus', 'linguee'))
+        self.assertIsNone(cache.get('Maus', 'linguee'))
+        self.assertIsNotNone(cache.get('Laus', 'linguee'))
+
+    def test_refresh_writes_but_never_reads(self):
+        self.cache().put('Haus', 'linguee', self.house())
+        refreshing = self.cache(refresh=True)
+        self.assertIsNone(refreshing.get('Haus', 'linguee'))
+        refreshing.put('Maus', 'linguee', self.house())
+        self.assertIsNotNone(self.cache().get('Maus', 'linguee'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,190 @@
+import json
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+from benchmarks.fakes import FakeAuthorizer
+from benchmarks.fixtures import FIXTURES
+from main.translation.PageCache import Page
+from main.translation.TranslationCache import TranslationCache
+from main.translation.Translator import Translator
+from tests.stand_ins import silence_logs
+
+
+class StandInHttp:
+    # Stands in for HttpClient, answering Linguee searches with the saved
+    # pages in tests/fixtures/linguee. Searches for phrases in `throttled`
+    # get a 503, as when Linguee's throttling us, and those in `broken`
+    # fail to connect. Each search takes `delay(phrase)` seconds. Verbformen
+    # only answers (with the pages in tests/fixtures/verbformen) if
+    # `verbformen` is True.
+    def __init__(
+            self, throttled=(), broken=(), delay=lambda phrase: 0,
+            verbformen=False):
+        self.pages = {}
+        for path in FIXTURES.joinpath('linguee').glob('*.json'):
+            query = json.loads(path.read_text(encoding='utf-8'))['query']
+            self.pages[query] = path.with_suffix('.html').read_bytes()
+        self.throttled = set(throttled)
+        self.broken = set(broken)
+        self.delay = delay
+        self.verbformen = verbformen
+        self.lock = threading.Lock()
+        self.searches = []
+
+    def get(self, url: str, **kwargs):
+        query = parse_qs(urlparse(url).query)
+        if 'query' not in query:
+            path = FIXTURES / 'verbformen' / f'{query["w"][0]}.html'
+            if not self.verbformen or not path.exists():
+                return Page(url, 503, b'Service Unavailable')
+            return Page(url, 200, path.read_bytes())
+        phrase = query['query'][0]
+        with self.lock:
+            self.searches.append(phrase)
+        time.sleep(self.delay(phrase))
+        if phrase in self.broken:
+            raise requests.ConnectionError(f'Couldn\'t connect for {phrase}')
+        if phrase in self.throttled:
+            return Page(url, 503, b'Service Unavailable')
+        return Page(url, 200, self.pages[phrase])
+
+
+class StandInDeepL:
+    # Stands in for deepl.Translator. The 'translation' of each text is just
+    # the text in brackets.
+    class Result:
+        def __init__(self, text: str):
+            self.text = text
+
+    def __init__(self):
+        self.batches = []
+
+    def translate_text(self, texts, source_lang, target_lang):
+        self.batches.append(list(texts))
+        return [self.Result(f'[{text}]') for text in texts]
+
+
+class StandInRateLimiter:
+    # Remembers what it was asked to wait for, without waiting.
+    def __init__(self):
+        self.urls = []
+
+    def wait(self, url: str):
+        self.urls.append(url)
+
+
+class TestTranslator(unittest.TestCase):
+    def setUp(self):
+        silence_logs(self)
+
+    def translator(self, http: StandInHttp) -> Translator:
+        translator = Translator(
+            'me', apple_dict={}, http=http,
+            authorizer=FakeAuthorizer(['me']))
+        translator.deepl = StandInDeepL()
+        return translator
+
+    def test_translate_many_keeps_order(self):
+        phrases = ['Haus', 'gehen', 'xyzzy', 'schnell', 'Häusle']
+        # The first phrases take longest, so they finish last.
+        http = StandInHttp(
+            delay=lambda phrase: 0.05 * (len(phrases) - phrases.index(phrase)))
+        translator = self.translator(http)
+        results = translator.translate_many(
+            phrases, max_concurrency=5, per_host_rate=None)
+        self.assertEqual(sorted(phrases), sorted(http.searches))
+        for german, translations in zip(phrases, results):
+            expected = translator.translate(german)
+            self.assertEqual(
+                [translation.__dict__ for translation in expected],
+                [translation.__dict__ for translation in translations])
+        # Phrases Linguee has nothing for go to DeepL together.
+        self.assertEqual([['xyzzy', 'Häusle']], translator.deepl.batches[:1])
+
+    def test_translate_many_isolates_failures(self):
+        http = StandInHttp(throttled={'gehen'}, broken={'schnell'})
+        translator = self.translator(http)
+        results = translator.translate_many(
+            ['Haus', 'gehen', 'xyzzy', 'schnell'], max_concurrency=4,
+            per_host_rate=None)
+        englishes = [
+            translations[0].english if translations is not None else None
+            for translations in results]
+        self.assertEqual(
+            ['house, home, building', None, '[xyzzy]', None], englishes)
+        # Throttled phrases aren't sent to DeepL instead.
+        self.assertEqual([['xyzzy']], translator.deepl.batches)
+
+    def test_rate_limits_deepl_by_its_host(self):
+        translator = self.translator(StandInHttp())
+        # FakeAuthorizer's key is for a free account.
+        self.assertEqual('https://api-free.deepl.com', translator.deepl_url)
+        translator.rate_limiter = StandInRateLimiter()
+        translator.deepl_translate_many(['xyzzy'])
+        self.assertEqual(
+            ['https://api-free.deepl.com'], translator.rate_limiter.urls)
+        with mock.patch(
+                'main.translation.Translator.DEEPL_SERVER_URL',
+                'http://127.0.0.1:8000'):
+            translator = self.translator(StandInHttp())
+        self.assertEqual('http://127.0.0.1:8000', translator.deepl_url)
+
+    def test_deepl_batches_cap_texts(self):
+        germans = [f'Wort{n}' for n in range(5)]
+        self.assertEqual(
+            [germans[:2], germans[2:4], germans[4:]],
+            list(Translator.deepl_batches(germans, 2, 1000)))
+
+    def test_deepl_batches_cap_characters(self):
+        germans = ['eins', 'zwei', 'drei', 'vier']
+        self.assertEqual(
+            [['eins', 'zwei'], ['drei', 'vier']],
+            list(Translator.deepl_batches(germans, 50, 8)))
+        # A phrase over the cap on its own still gets sent, by itself.
+        self.assertEqual(
+            [['eins'], ['Donaudampfschiff'], ['zwei']],
+            list(Translator.deepl_batches(
+                ['eins', 'Donaudampfschiff', 'zwei'], 50, 8)))
+        self.assertEqual([], list(Translator.deepl_batches([], 50, 8)))
+
+    def test_deepl_translate_many(self):
+        translator = self.translator(StandInHttp())
+        results = translator.deepl_translate_many(
+            ['eins', 'zwei', 'eins', 'drei'], max_texts=2)
+        self.assertEqual(
+            ['[eins]', '[zwei]', '[eins]', '[drei]'],
+            [translations[0].english for translations in results])
+        # Each phrase is only sent once, two at a time.
+        self.assertEqual(
+            [['eins', 'zwei'], ['drei']], translator.deepl.batches)
+
+    def test_translate_many_empty(self):
+        translator = self.translator(StandInHttp())
+        self.assertEqual([], translator.translate_many([]))
+        self.assertEqual([], translator.deepl.batches)
+
+    def test_only_caches_complete_translations(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        cache = TranslationCache(f'{directory.name}/translations.db')
+        self.addCleanup(cache.connection.close)
+        for verbformen in [False, True]:
+            translator = self.translator(StandInHttp(verbformen=verbformen))
+            translator.cache = cache
+            conjugations = [
+                translation.conjugation
+                for translation in translator.translate('gehen')
+                if translation.category == 'verb']
+            self.assertEqual(verbformen, None not in conjugations)
+            self.assertEqual(
+                verbformen, cache.get('gehen', 'Linguee') is not None)
+
+
+if __name__ == '__main__':
+    unittest.main()